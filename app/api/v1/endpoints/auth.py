@@ -128,7 +128,8 @@ async def login(
                 user_id=token_data.get('user_id'),
                 ip_address=client_ip,
                 user_agent=user_agent,
-                details={"reason": "profile_not_found", "username": credentials.username}
+                details={"reason": "profile_not_found", "username": credentials.username},
+                buffered=True
             )
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -182,7 +183,8 @@ async def login(
                 "username": credentials.username,
                 "error": str(e.detail),
                 "status_code": e.status_code
-            }
+            },
+            buffered=True
         )
         raise
     except Exception as e:
@@ -195,7 +197,8 @@ async def login(
                 "username": credentials.username,
                 "error": str(e),
                 "error_type": type(e).__name__
-            }
+            },
+            buffered=True
         )
         logger.error(f"Login error: {e}")
         raise HTTPException(
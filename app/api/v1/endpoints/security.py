@@ -7,7 +7,7 @@ from datetime import datetime, timedelta
 from pydantic import BaseModel
 
 from app.core.database import get_database
-from app.services.security_service import SecurityService, SecurityEventType
+from app.services.security_service import SecurityService, SecurityEventType, FeaturePermission
 from app.services.security_monitoring_service import SecurityMonitoringService
 from app.core.security_middleware import get_current_user, RoleBasedAccessControl
 from app.models.user import UserRole
@@ -270,12 +270,12 @@ async def check_user_permissions(
         user_role = current_user["role"]
         
         # Get permissions for user role
-        permissions = security_service.role_permissions.get(user_role, [])
+        permissions = security_service.role_permissions.get(user_role, frozenset())
         
         return {
             "user_id": current_user["user_id"],
             "role": user_role.value if hasattr(user_role, 'value') else str(user_role),
-            "permissions": [perm.value for perm in permissions]
+            "permissions": [perm.value for perm in FeaturePermission if perm in permissions]
         }
         
     except Exception as e:
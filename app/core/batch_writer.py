@@ -0,0 +1,89 @@
+"""
+Batched document writer shared by services that buffer inserts
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Buffered documents are written once either limit is reached
+_DEFAULT_BATCH_SIZE = 500
+_DEFAULT_FLUSH_INTERVAL_SECONDS = 0.1
+
+
+class BatchWriter:
+    """Queue documents and hand them to a batch write from a single background task
+    
+    The queue and its task are bound to the running event loop and recreated when
+    used from a new loop, so one writer can be shared at class level by services
+    that are constructed per request.
+    """
+    
+    def __init__(
+        self,
+        description: str,
+        max_batch_size: int = _DEFAULT_BATCH_SIZE,
+        flush_interval_seconds: float = _DEFAULT_FLUSH_INTERVAL_SECONDS
+    ):
+        self.description = description
+        self.max_batch_size = max_batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    async def put(
+        self,
+        document: Dict[str, Any],
+        write_batch: Callable[[List[Dict[str, Any]]], Awaitable[None]]
+    ) -> None:
+        """Queue a document, starting the writer with write_batch if none is running on this loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._loop = loop
+            self._task = asyncio.create_task(self._run(self._queue, write_batch))
+        
+        await self._queue.put(document)
+    
+    async def _run(
+        self,
+        queue: asyncio.Queue,
+        write_batch: Callable[[List[Dict[str, Any]]], Awaitable[None]]
+    ) -> None:
+        """Drain the queue into batches of up to max_batch_size"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.flush_interval_seconds
+            
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                await write_batch(batch)
+            except Exception as e:
+                logger.error(f"Error writing {len(batch)} buffered {self.description}: {e}")
+            finally:
+                for _ in batch:
+                    queue.task_done()
+    
+    async def flush(self, timeout: float = 5.0) -> None:
+        """Wait for queued documents on this loop to be written, then stop the writer"""
+        loop = asyncio.get_running_loop()
+        queue, task = self._queue, self._task
+        if self._loop is loop and task is not None and not task.done():
+            try:
+                await asyncio.wait_for(queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Timed out flushing %d buffered %s", queue.qsize(), self.description)
+            
+            task.cancel()
+        self._queue = self._task = self._loop = None
@@ -28,6 +28,11 @@ class Settings(BaseSettings):
     # Database Configuration
     MONGODB_URL: str = "mongodb://localhost:27017"
     MONGODB_DATABASE: str = "learning_analytics"
+    MONGODB_MAX_POOL_SIZE: int = 200
+    MONGODB_MIN_POOL_SIZE: int = 20
+    MONGODB_MAX_IDLE_TIME_MS: int = 60000
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = 2000
+    MONGODB_COMPRESSORS: str = "zstd,zlib"
     
     # Redis Configuration
     REDIS_URL: str = "redis://localhost:6379"
@@ -19,8 +19,15 @@ async def init_database():
     global client, database
     
     try:
-        # Create MongoDB client
-        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        # Create MongoDB client, shared by all services, with a pool sized for peak query fan-out
+        client = AsyncIOMotorClient(
+            settings.MONGODB_URL,
+            maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+            minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+            maxIdleTimeMS=settings.MONGODB_MAX_IDLE_TIME_MS,
+            waitQueueTimeoutMS=settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+            compressors=settings.MONGODB_COMPRESSORS
+        )
         database = client[settings.MONGODB_DATABASE]
         
         # Test connection
@@ -55,7 +62,10 @@ async def create_indexes():
         IndexModel([("course_id", ASCENDING), ("assignment_id", ASCENDING)]),
         IndexModel([("submission_type", ASCENDING)]),
         IndexModel([("timestamp", DESCENDING)]),
-        IndexModel([("student_id", ASCENDING), ("course_id", ASCENDING)])
+        IndexModel([("student_id", ASCENDING), ("course_id", ASCENDING)]),
+        # Prerequisite competency lookups by concept tag and score
+        IndexModel([("student_id", ASCENDING), ("metadata.concept_tags", ASCENDING), ("score", ASCENDING)]),
+        IndexModel([("student_id", ASCENDING), ("question_responses.concept_tags", ASCENDING), ("score", ASCENDING)])
     ]
     await database.student_performance.create_indexes(performance_indexes)
     
@@ -73,10 +83,68 @@ async def create_indexes():
         IndexModel([("student_id", ASCENDING), ("priority_score", DESCENDING)]),
         IndexModel([("gap_id", ASCENDING)]),
         IndexModel([("generated_at", DESCENDING)]),
-        IndexModel([("completed", ASCENDING)])
+        IndexModel([("completed", ASCENDING)]),
+        IndexModel([("recommendation_id", ASCENDING)])
     ]
     await database.recommendations.create_indexes(recommendation_indexes)
     
+    # Recommendation metrics indexes
+    metrics_indexes = [
+        IndexModel([("recommendation_id", ASCENDING)], unique=True)
+    ]
+    await database.recommendation_metrics.create_indexes(metrics_indexes)
+    
+    # Recommendation feedback indexes
+    feedback_indexes = [
+        IndexModel([("student_id", ASCENDING), ("completed", ASCENDING), ("recommendation_id", ASCENDING)])
+    ]
+    await database.recommendation_feedback.create_indexes(feedback_indexes)
+    
+    # Data retention compliance indexes
+    await database.users.create_indexes([
+        IndexModel([("last_login", ASCENDING), ("account_status", ASCENDING)])
+    ])
+    
+    # Security events indexes
+    security_event_indexes = [
+        IndexModel([("processed", ASCENDING), ("timestamp", ASCENDING)]),
+        # TTL index bounds the collection to the 90 day retention window
+        IndexModel([("timestamp", DESCENDING)], expireAfterSeconds=90 * 24 * 3600),
+        # Attack pattern checks match recent events by IP or by user
+        IndexModel([("ip_address", ASCENDING), ("timestamp", DESCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)]),
+        IndexModel([("event_type", ASCENDING), ("timestamp", DESCENDING)]),
+        # Per-type counts and listings for a user or an IP (suspicious activity checks, event queries)
+        IndexModel([("user_id", ASCENDING), ("event_type", ASCENDING), ("timestamp", DESCENDING)]),
+        IndexModel([("ip_address", ASCENDING), ("event_type", ASCENDING), ("timestamp", DESCENDING)]),
+        # Covers the dashboard's top threat sources aggregation
+        IndexModel([("timestamp", ASCENDING), ("threat_score", DESCENDING), ("ip_address", ASCENDING)])
+    ]
+    await database.security_events.create_indexes(security_event_indexes)
+    
+    # Resolved alert and violation cleanup indexes; TTL indexes expire resolved
+    # documents in the background (unresolved documents have no resolved_at date)
+    await database.security_alerts.create_indexes([
+        IndexModel([("resolved", ASCENDING), ("resolved_at", ASCENDING)]),
+        IndexModel([("resolved_at", ASCENDING)], expireAfterSeconds=30 * 24 * 3600)
+    ])
+    await database.compliance_violations.create_indexes([
+        IndexModel([("resolved", ASCENDING), ("resolved_at", ASCENDING)]),
+        IndexModel([("resolved_at", ASCENDING)], expireAfterSeconds=365 * 24 * 3600)
+    ])
+    
+    # Session lookups are by token; the TTL index removes sessions once they expire
+    await database.user_sessions.create_indexes([
+        IndexModel([("session_token", ASCENDING)], unique=True),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    ])
+    
+    # Per-user daily activity counts; days older than the 30 day window expire
+    await database.user_activity_stats.create_indexes([
+        IndexModel([("user_id", ASCENDING), ("day", ASCENDING)], unique=True),
+        IndexModel([("day", ASCENDING)], expireAfterSeconds=31 * 24 * 3600)
+    ])
+    
     logger.info("Database indexes created successfully")
 
 
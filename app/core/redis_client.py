@@ -4,7 +4,8 @@ Redis client configuration for caching and session management
 import redis.asyncio as redis
 import json
 import logging
-from typing import Any, Optional
+import time
+from typing import Any, Dict, List, Optional, Union
 
 from app.core.config import settings
 
@@ -62,6 +63,57 @@ class CacheManager:
             logger.error(f"Failed to set cache for key {key}: {e}")
             return False
     
+    @staticmethod
+    async def set_if_not_exists(key: str, value: Any, expire: int = 3600) -> Optional[bool]:
+        """Atomically set cache value unless the key exists; None if Redis could not be reached"""
+        try:
+            serialized_value = json.dumps(value) if not isinstance(value, str) else value
+            return bool(await redis_client.set(key, serialized_value, ex=expire, nx=True))
+        except Exception as e:
+            logger.error(f"Failed to set cache for key {key}: {e}")
+            return None
+    
+    @staticmethod
+    async def add_to_sliding_window(
+        key: str,
+        member: Union[str, Dict[str, int]],
+        window_seconds: int
+    ) -> Optional[int]:
+        """
+        Record members in a sorted-set sliding window and return the window size; None on failure
+        
+        A single member is scored with the current time; a mapping gives each member's epoch milliseconds.
+        """
+        try:
+            now_ms = int(time.time() * 1000)
+            members = {member: now_ms} if isinstance(member, str) else member
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.zadd(key, members)
+                pipe.zremrangebyscore(key, 0, now_ms - window_seconds * 1000)
+                pipe.zcard(key)
+                pipe.expire(key, window_seconds)
+                _, _, window_size, _ = await pipe.execute()
+            return window_size
+        except Exception as e:
+            logger.error(f"Failed to update sliding window {key}: {e}")
+            return None
+    
+    @staticmethod
+    async def record_recent_member(key: str, member: str, window_seconds: int) -> Optional[List[str]]:
+        """Mark a member as seen now and return the members previously seen within the window; None on failure"""
+        try:
+            now_ms = int(time.time() * 1000)
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.zremrangebyscore(key, 0, now_ms - window_seconds * 1000)
+                pipe.zrange(key, 0, -1)
+                pipe.zadd(key, {member: now_ms})
+                pipe.expire(key, window_seconds)
+                _, recent_members, _, _ = await pipe.execute()
+            return recent_members
+        except Exception as e:
+            logger.error(f"Failed to record recent member in {key}: {e}")
+            return None
+    
     @staticmethod
     async def get_cache(key: str) -> Optional[Any]:
         """Get cache value"""
@@ -79,6 +131,15 @@ class CacheManager:
             logger.error(f"Failed to get cache for key {key}: {e}")
             return None
     
+    @staticmethod
+    async def cache_exists(key: str) -> bool:
+        """Check whether a cache key exists"""
+        try:
+            return await redis_client.exists(key) > 0
+        except Exception as e:
+            logger.error(f"Failed to check cache for key {key}: {e}")
+            return False
+    
     @staticmethod
     async def delete_cache(key: str) -> bool:
         """Delete cache value"""
@@ -51,14 +51,16 @@ class SecurityMiddleware(BaseHTTPMiddleware):
                         ip_address=client_ip,
                         user_agent=request.headers.get("user-agent"),
                         event_details={"reason": "blocked_suspicious_ip"},
-                        severity="high"
+                        severity="high",
+                        buffered=True
                     )
                 else:
                     await security_service.log_security_event(
                         event_type=SecurityEventType.SUSPICIOUS_ACTIVITY,
                         ip_address=client_ip,
                         user_agent=request.headers.get("user-agent"),
-                        details={"reason": "blocked_suspicious_ip"}
+                        details={"reason": "blocked_suspicious_ip"},
+                        buffered=True
                     )
                 raise HTTPException(
                     status_code=status.HTTP_429_TOO_MANY_REQUESTS,
@@ -73,14 +75,16 @@ class SecurityMiddleware(BaseHTTPMiddleware):
                         ip_address=client_ip,
                         user_agent=request.headers.get("user-agent"),
                         event_details={"requests_per_minute": self.rate_limit_requests},
-                        severity="medium"
+                        severity="medium",
+                        buffered=True
                     )
                 elif security_service:
                     await security_service.log_security_event(
                         event_type=SecurityEventType.RATE_LIMIT_EXCEEDED,
                         ip_address=client_ip,
                         user_agent=request.headers.get("user-agent"),
-                        details={"requests_per_minute": self.rate_limit_requests}
+                        details={"requests_per_minute": self.rate_limit_requests},
+                        buffered=True
                     )
                 raise HTTPException(
                     status_code=status.HTTP_429_TOO_MANY_REQUESTS,
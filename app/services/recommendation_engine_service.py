@@ -1,12 +1,16 @@
 """
 Recommendation Engine Service for personalized learning recommendations
 """
+import asyncio
 import logging
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta
 from motor.motor_asyncio import AsyncIOMotorDatabase
+import os
 import uuid
 import math
+import heapq
+import numpy as np
 
 from app.models.recommendations import (
     RecommendationRequest, RecommendationResponse, Recommendation,
@@ -19,6 +23,110 @@ from app.services.recommendation_prioritization_service import RecommendationPri
 
 logger = logging.getLogger(__name__)
 
+# Number of recommendations returned to the student
+_MAX_RECOMMENDATIONS = 20
+
+# Candidates kept for personalization filtering (3x to allow filter attrition)
+_CANDIDATE_SHORTLIST_SIZE = _MAX_RECOMMENDATIONS * 3
+
+# Position of each difficulty level on the beginner -> expert scale
+_DIFFICULTY_INDEX = {
+    DifficultyLevel.BEGINNER: 0,
+    DifficultyLevel.INTERMEDIATE: 1,
+    DifficultyLevel.ADVANCED: 2,
+    DifficultyLevel.EXPERT: 3
+}
+
+# Resource types that suit each learning style
+_STYLE_PREFERRED_TYPES = {
+    LearningStyle.VISUAL: frozenset({ResourceType.VIDEO, ResourceType.INTERACTIVE}),
+    LearningStyle.AUDITORY: frozenset({ResourceType.VIDEO, ResourceType.COURSE}),
+    LearningStyle.KINESTHETIC: frozenset({ResourceType.INTERACTIVE, ResourceType.PROJECT}),
+    LearningStyle.READING_WRITING: frozenset({ResourceType.ARTICLE, ResourceType.BOOK, ResourceType.TUTORIAL})
+}
+
+# Candidate lists longer than this are scored with NumPy instead of per-item arithmetic
+_VECTORIZE_THRESHOLD = 50
+
+
+def _scale_confidence_scores(recommendations: List[Recommendation], weight: float) -> None:
+    """Scale confidence scores in place by an algorithm weight"""
+    if len(recommendations) <= _VECTORIZE_THRESHOLD:
+        for rec in recommendations:
+            rec.confidence_score *= weight
+        return
+    
+    scores = np.fromiter(
+        (rec.confidence_score for rec in recommendations),
+        dtype=np.float64,
+        count=len(recommendations)
+    ) * weight
+    for rec, score in zip(recommendations, scores.tolist()):
+        rec.confidence_score = score
+
+
+def _generate_ids(count: int) -> List[str]:
+    """Generate random (version 4) UUID strings from a single urandom read"""
+    buffer = os.urandom(16 * count)
+    return [
+        str(uuid.UUID(bytes=buffer[i * 16:(i + 1) * 16], version=4))
+        for i in range(count)
+    ]
+
+
+# Mock concept dependencies - in production, this would come from a knowledge base
+_CONCEPT_DEPENDENCIES: Dict[str, List[str]] = {
+    "python_basics": [],
+    "functions": ["python_basics"],
+    "loops": ["python_basics"],
+    "data_structures": ["python_basics", "functions"],
+    "oop": ["functions", "data_structures"],
+    "algorithms": ["data_structures", "loops"],
+    "complexity": ["algorithms"],
+    "python_advanced": ["oop", "algorithms"]
+}
+
+# Mock resources for concepts, validated once at import so path generation
+# is a plain lookup - in production, these would come from a resource catalog
+_CONCEPT_RESOURCES: Dict[str, List[LearningResource]] = {
+    concept: [LearningResource(**resource) for resource in resources]
+    for concept, resources in {
+        "python_basics": [{
+            "resource_id": "res_python_basics",
+            "title": "Python Fundamentals",
+            "description": "Learn Python basics: variables, data types, operators",
+            "resource_type": "course",
+            "difficulty_level": "beginner",
+            "concepts": ["python_basics"],
+            "prerequisites": [],
+            "estimated_duration": 120,
+            "url": "https://example.com/python-basics"
+        }],
+        "functions": [{
+            "resource_id": "res_functions",
+            "title": "Python Functions Mastery",
+            "description": "Master function definition, parameters, and return values",
+            "resource_type": "tutorial",
+            "difficulty_level": "beginner",
+            "concepts": ["functions"],
+            "prerequisites": ["python_basics"],
+            "estimated_duration": 90,
+            "url": "https://example.com/functions"
+        }],
+        "loops": [{
+            "resource_id": "res_loops",
+            "title": "Loops and Iteration",
+            "description": "Master for loops, while loops, and iteration patterns",
+            "resource_type": "interactive",
+            "difficulty_level": "intermediate",
+            "concepts": ["loops"],
+            "prerequisites": ["python_basics"],
+            "estimated_duration": 75,
+            "url": "https://example.com/loops"
+        }]
+    }.items()
+}
+
 
 class LearningPathGenerator:
     """Generates structured learning paths with prerequisite ordering"""
@@ -34,17 +142,25 @@ class LearningPathGenerator:
     ) -> LearningPath:
         """Generate a learning path with proper prerequisite ordering"""
         try:
-            # Build concept dependency graph
-            concept_graph = await self._build_concept_graph(target_concepts)
+            if len(target_concepts) <= 1:
+                # Nothing to order, so skip graph construction and sorting
+                ordered_concepts = list(target_concepts)
+            else:
+                # Build concept dependency graph
+                concept_graph = await self._build_concept_graph(target_concepts)
+                
+                # Order concepts by prerequisites (topological sort)
+                ordered_concepts = self._topological_sort(concept_graph)
             
-            # Order concepts by prerequisites (topological sort)
-            ordered_concepts = self._topological_sort(concept_graph)
+            # One id per concept plus one for the path itself
+            ids = _generate_ids(len(ordered_concepts) + 1)
+            path_id = ids.pop()
             
             # Generate recommendations for each concept in order
             path_recommendations = []
             total_duration = 0
             
-            for concept in ordered_concepts:
+            for concept, recommendation_id in zip(ordered_concepts, ids):
                 if max_duration and total_duration >= max_duration:
                     break
                 
@@ -55,9 +171,9 @@ class LearningPathGenerator:
                     best_resource = concept_resources[0]  # Take the best one
                     
                     rec = Recommendation(
-                        recommendation_id=str(uuid.uuid4()),
+                        recommendation_id=recommendation_id,
                         student_id=student_id,
-                        resource=LearningResource(**best_resource),
+                        resource=best_resource,
                         recommendation_type=RecommendationType.LEARNING_RESOURCE,
                         confidence_score=0.8,
                         priority_score=0.9,
@@ -68,11 +184,11 @@ class LearningPathGenerator:
                     )
                     
                     path_recommendations.append(rec)
-                    total_duration += best_resource["estimated_duration"]
+                    total_duration += best_resource.estimated_duration
             
             # Create learning path
             path = LearningPath(
-                path_id=str(uuid.uuid4()),
+                path_id=path_id,
                 student_id=student_id,
                 title=f"Learning Path: {', '.join(target_concepts)}",
                 description=f"Structured path to master {len(target_concepts)} concepts",
@@ -90,27 +206,8 @@ class LearningPathGenerator:
     
     async def _build_concept_graph(self, concepts: List[str]) -> Dict[str, List[str]]:
         """Build a dependency graph for concepts"""
-        # Mock concept dependencies - in production, this would come from a knowledge base
-        concept_dependencies = {
-            "python_basics": [],
-            "functions": ["python_basics"],
-            "loops": ["python_basics"],
-            "data_structures": ["python_basics", "functions"],
-            "oop": ["functions", "data_structures"],
-            "algorithms": ["data_structures", "loops"],
-            "complexity": ["algorithms"],
-            "python_advanced": ["oop", "algorithms"]
-        }
-        
-        # Build subgraph for requested concepts
-        graph = {}
-        for concept in concepts:
-            if concept in concept_dependencies:
-                graph[concept] = concept_dependencies[concept]
-            else:
-                graph[concept] = []  # No known dependencies
-        
-        return graph
+        # Build subgraph for requested concepts, concepts without known dependencies map to []
+        return {concept: _CONCEPT_DEPENDENCIES.get(concept, []) for concept in concepts}
     
     def _topological_sort(self, graph: Dict[str, List[str]]) -> List[str]:
         """Perform topological sort to order concepts by prerequisites"""
@@ -144,46 +241,9 @@ class LearningPathGenerator:
         
         return result
     
-    async def _get_concept_resources(self, concept: str) -> List[Dict[str, Any]]:
+    async def _get_concept_resources(self, concept: str) -> List[LearningResource]:
         """Get resources for a specific concept"""
-        # Mock resources for concepts
-        concept_resources = {
-            "python_basics": [{
-                "resource_id": "res_python_basics",
-                "title": "Python Fundamentals",
-                "description": "Learn Python basics: variables, data types, operators",
-                "resource_type": "course",
-                "difficulty_level": "beginner",
-                "concepts": ["python_basics"],
-                "prerequisites": [],
-                "estimated_duration": 120,
-                "url": "https://example.com/python-basics"
-            }],
-            "functions": [{
-                "resource_id": "res_functions",
-                "title": "Python Functions Mastery",
-                "description": "Master function definition, parameters, and return values",
-                "resource_type": "tutorial",
-                "difficulty_level": "beginner",
-                "concepts": ["functions"],
-                "prerequisites": ["python_basics"],
-                "estimated_duration": 90,
-                "url": "https://example.com/functions"
-            }],
-            "loops": [{
-                "resource_id": "res_loops",
-                "title": "Loops and Iteration",
-                "description": "Master for loops, while loops, and iteration patterns",
-                "resource_type": "interactive",
-                "difficulty_level": "intermediate",
-                "concepts": ["loops"],
-                "prerequisites": ["python_basics"],
-                "estimated_duration": 75,
-                "url": "https://example.com/loops"
-            }]
-        }
-        
-        return concept_resources.get(concept, [])
+        return _CONCEPT_RESOURCES.get(concept, [])
 
 
 class RecommendationEngineService:
@@ -226,17 +286,18 @@ class RecommendationEngineService:
             )
             
             # Combine and rank recommendations
-            combined_recs = self._combine_recommendations(
+            # Only the shortlisted candidates go through the prerequisite lookups
+            shortlisted_recs = self._combine_recommendations(
                 collaborative_recs, content_based_recs, merged_request
             )
             
             # Apply personalization filters
             personalized_recs = await self._apply_personalization_filters(
-                combined_recs, merged_request, student_prefs
+                shortlisted_recs, merged_request, student_prefs
             )
             
             # Limit to reasonable number of recommendations
-            final_recs = personalized_recs[:20]  # Top 20 recommendations
+            final_recs = personalized_recs[:_MAX_RECOMMENDATIONS]
             
             # Store recommendations for tracking
             await self._store_recommendations(final_recs)
@@ -312,10 +373,11 @@ class RecommendationEngineService:
                 "created_at": datetime.utcnow()
             }
             
-            await self.db.recommendation_feedback.insert_one(feedback_record)
-            
-            # Update recommendation metrics
-            await self._update_recommendation_metrics(recommendation_id, feedback_data)
+            # Feedback insert and metrics update touch different collections, so run them concurrently
+            await asyncio.gather(
+                self.db.recommendation_feedback.insert_one(feedback_record),
+                self._update_recommendation_metrics(recommendation_id, feedback_data)
+            )
             
             logger.info(f"Updated feedback for recommendation {recommendation_id}")
             return True
@@ -338,7 +400,18 @@ class RecommendationEngineService:
     async def _get_learning_history(self, student_id: str) -> List[Dict[str, Any]]:
         """Get student's learning history"""
         try:
-            cursor = self.db.student_performance.find({"student_id": student_id}).sort("timestamp", -1)
+            # Only the fields read by the filtering algorithms cross the wire
+            cursor = self.db.student_performance.find(
+                {"student_id": student_id},
+                projection={
+                    "_id": 0,
+                    "score": 1,
+                    "max_score": 1,
+                    "timestamp": 1,
+                    "metadata.concept_tags": 1,
+                    "question_responses.concept_tags": 1
+                }
+            ).sort("timestamp", -1)
             history = await cursor.to_list(length=100)  # Last 100 submissions
             return history
         except Exception as e:
@@ -355,21 +428,25 @@ class RecommendationEngineService:
             return request
         
         # Use request preferences if provided, otherwise fall back to stored preferences
-        merged_data = request.dict()
+        changes = {}
         
-        if not merged_data.get("learning_style") and stored_prefs.learning_style:
-            merged_data["learning_style"] = stored_prefs.learning_style
+        if not request.learning_style and stored_prefs.learning_style:
+            changes["learning_style"] = stored_prefs.learning_style
         
-        if not merged_data.get("difficulty_preference") and stored_prefs.difficulty_preference:
-            merged_data["difficulty_preference"] = stored_prefs.difficulty_preference
+        if not request.difficulty_preference and stored_prefs.difficulty_preference:
+            changes["difficulty_preference"] = stored_prefs.difficulty_preference
         
-        if not merged_data.get("resource_types") and stored_prefs.preferred_resource_types:
-            merged_data["resource_types"] = stored_prefs.preferred_resource_types
+        if not request.resource_types and stored_prefs.preferred_resource_types:
+            changes["resource_types"] = stored_prefs.preferred_resource_types
         
-        if not merged_data.get("time_available") and stored_prefs.study_time_preference:
-            merged_data["time_available"] = stored_prefs.study_time_preference
+        if not request.time_available and stored_prefs.study_time_preference:
+            changes["time_available"] = stored_prefs.study_time_preference
         
-        return RecommendationRequest(**merged_data)
+        if not changes:
+            return request
+        
+        # Stored preferences are already validated, so only the changed fields are copied in
+        return request.model_copy(update=changes)
     
     def _combine_recommendations(
         self, 
@@ -377,33 +454,57 @@ class RecommendationEngineService:
         content_based_recs: List[Recommendation],
         request: RecommendationRequest
     ) -> List[Recommendation]:
-        """Combine recommendations from different algorithms"""
+        """Combine recommendations from different algorithms into a ranked shortlist"""
         # Create a map to avoid duplicates
         rec_map = {}
         
         # Add collaborative filtering recommendations with higher weight
+        _scale_confidence_scores(collaborative_recs, 0.7)  # Weight for collaborative filtering
         for rec in collaborative_recs:
-            rec.confidence_score *= 0.7  # Weight for collaborative filtering
             rec_map[rec.resource.resource_id] = rec
         
-        # Add content-based recommendations
+        # Add content-based recommendations, collecting merged reasonings to join once
+        _scale_confidence_scores(content_based_recs, 0.5)  # Weight for content-based
+        reason_parts: Dict[str, List[str]] = {}
         for rec in content_based_recs:
             resource_id = rec.resource.resource_id
             if resource_id in rec_map:
                 # Combine scores if resource already exists
                 existing_rec = rec_map[resource_id]
-                combined_score = (existing_rec.confidence_score + rec.confidence_score * 0.5) / 1.5
+                combined_score = (existing_rec.confidence_score + rec.confidence_score) / 1.5
                 existing_rec.confidence_score = min(combined_score, 1.0)
-                existing_rec.reasoning += f" | {rec.reasoning}"
+                reason_parts.setdefault(resource_id, [existing_rec.reasoning]).append(rec.reasoning)
             else:
-                rec.confidence_score *= 0.5  # Weight for content-based
                 rec_map[resource_id] = rec
         
-        # Sort by combined confidence score
-        combined_recs = list(rec_map.values())
-        combined_recs.sort(key=lambda x: x.confidence_score, reverse=True)
+        for resource_id, parts in reason_parts.items():
+            rec_map[resource_id].reasoning = " | ".join(parts)
         
-        return combined_recs
+        # Drop candidates the request rules out, then keep the top ones in final ranking order
+        candidates = (rec for rec in rec_map.values() if self._matches_request(rec, request))
+        return heapq.nlargest(
+            _CANDIDATE_SHORTLIST_SIZE, candidates, key=lambda x: (x.priority_score, x.confidence_score)
+        )
+    
+    def _matches_request(self, rec: Recommendation, request: RecommendationRequest) -> bool:
+        """Check the request's time, resource type and difficulty filters"""
+        # Filter by time availability
+        if request.time_available and rec.resource.estimated_duration > request.time_available:
+            return False
+        
+        # Filter by resource type preferences
+        if request.resource_types and rec.resource.resource_type not in request.resource_types:
+            return False
+        
+        # Filter by difficulty preference
+        if request.difficulty_preference and rec.resource.difficulty_level != request.difficulty_preference:
+            # Allow one level up or down
+            pref_idx = _DIFFICULTY_INDEX[request.difficulty_preference]
+            rec_idx = _DIFFICULTY_INDEX[rec.resource.difficulty_level]
+            if abs(pref_idx - rec_idx) > 1:
+                return False
+        
+        return True
     
     async def _apply_personalization_filters(
         self, 
@@ -415,24 +516,9 @@ class RecommendationEngineService:
         filtered_recs = []
         
         for rec in recommendations:
-            # Filter by time availability
-            if request.time_available and rec.resource.estimated_duration > request.time_available:
+            if not self._matches_request(rec, request):
                 continue
             
-            # Filter by resource type preferences
-            if request.resource_types and rec.resource.resource_type not in request.resource_types:
-                continue
-            
-            # Filter by difficulty preference
-            if request.difficulty_preference and rec.resource.difficulty_level != request.difficulty_preference:
-                # Allow one level up or down
-                difficulty_order = [DifficultyLevel.BEGINNER, DifficultyLevel.INTERMEDIATE, 
-                                 DifficultyLevel.ADVANCED, DifficultyLevel.EXPERT]
-                pref_idx = difficulty_order.index(request.difficulty_preference)
-                rec_idx = difficulty_order.index(rec.resource.difficulty_level)
-                if abs(pref_idx - rec_idx) > 1:
-                    continue
-            
             # Boost score based on learning style match
             if request.learning_style:
                 rec.confidence_score = self._apply_learning_style_boost(rec, request.learning_style)
@@ -457,15 +543,7 @@ class RecommendationEngineService:
         """Apply learning style boost to recommendation score"""
         base_score = rec.confidence_score
         
-        # Define resource type preferences for each learning style
-        style_preferences = {
-            LearningStyle.VISUAL: [ResourceType.VIDEO, ResourceType.INTERACTIVE],
-            LearningStyle.AUDITORY: [ResourceType.VIDEO, ResourceType.COURSE],
-            LearningStyle.KINESTHETIC: [ResourceType.INTERACTIVE, ResourceType.PROJECT],
-            LearningStyle.READING_WRITING: [ResourceType.ARTICLE, ResourceType.BOOK, ResourceType.TUTORIAL]
-        }
-        
-        preferred_types = style_preferences.get(learning_style, [])
+        preferred_types = _STYLE_PREFERRED_TYPES.get(learning_style, frozenset())
         
         if rec.resource.resource_type in preferred_types:
             # Boost score by 20% for matching learning style
@@ -489,7 +567,7 @@ class RecommendationEngineService:
                         {"question_responses.concept_tags": concept}
                     ],
                     "score": {"$gte": 0.7}  # 70% threshold for competency
-                })
+                }, projection={"_id": 1})
                 
                 if not performance:
                     return False
@@ -503,9 +581,13 @@ class RecommendationEngineService:
     async def _store_recommendations(self, recommendations: List[Recommendation]) -> None:
         """Store recommendations for tracking and analytics"""
         try:
+            if not recommendations:
+                return
+            
             rec_docs = [rec.dict() for rec in recommendations]
-            if rec_docs:
-                await self.db.recommendations.insert_many(rec_docs)
+            
+            # One unordered round trip; acknowledged because later reads and updates rely on these rows
+            await self.db.recommendations.insert_many(rec_docs, ordered=False)
         except Exception as e:
             logger.error(f"Error storing recommendations: {e}")
     
@@ -516,52 +598,68 @@ class RecommendationEngineService:
     ) -> None:
         """Update recommendation performance metrics"""
         try:
-            # Get existing metrics or create new
-            metrics = await self.db.recommendation_metrics.find_one(
-                {"recommendation_id": recommendation_id}
-            )
-            
-            if not metrics:
-                metrics = {
-                    "recommendation_id": recommendation_id,
-                    "student_id": feedback_data.get("student_id"),
-                    "click_through_rate": 0.0,
-                    "completion_rate": 0.0,
-                    "average_rating": None,
-                    "total_interactions": 0,
-                    "successful_completions": 0,
-                    "average_time_to_complete": None
+            # Counters are incremented server-side in a single pipeline update so
+            # concurrent feedback for the same recommendation cannot lose updates
+            new_rating = feedback_data.get("effectiveness_rating")
+            
+            if new_rating:
+                # Running average over all interactions, seeded by the first rating
+                average_rating = {
+                    "$cond": [
+                        {"$eq": [{"$ifNull": ["$average_rating", 0]}, 0]},
+                        {"$literal": new_rating},
+                        {
+                            "$divide": [
+                                {
+                                    "$add": [
+                                        {"$multiply": [
+                                            "$average_rating",
+                                            {"$subtract": ["$total_interactions", 1]}
+                                        ]},
+                                        {"$literal": new_rating}
+                                    ]
+                                },
+                                "$total_interactions"
+                            ]
+                        }
+                    ]
                 }
+            else:
+                average_rating = {"$ifNull": ["$average_rating", None]}
+            
+            pipeline = [
+                {
+                    "$set": {
+                        "student_id": {
+                            "$ifNull": ["$student_id", {"$literal": feedback_data.get("student_id")}]
+                        },
+                        "click_through_rate": {"$ifNull": ["$click_through_rate", 0.0]},
+                        "average_time_to_complete": {"$ifNull": ["$average_time_to_complete", None]},
+                        "total_interactions": {
+                            "$add": [{"$ifNull": ["$total_interactions", 0]}, 1]
+                        },
+                        "successful_completions": {
+                            "$add": [
+                                {"$ifNull": ["$successful_completions", 0]},
+                                1 if feedback_data.get("completed") else 0
+                            ]
+                        },
+                        "last_updated": datetime.utcnow()
+                    }
+                },
+                {
+                    "$set": {
+                        "completion_rate": {
+                            "$divide": ["$successful_completions", "$total_interactions"]
+                        },
+                        "average_rating": average_rating
+                    }
+                }
+            ]
             
-            # Update metrics based on feedback
-            metrics["total_interactions"] += 1
-            
-            if feedback_data.get("completed"):
-                metrics["successful_completions"] += 1
-            
-            # Recalculate completion rate
-            metrics["completion_rate"] = metrics["successful_completions"] / metrics["total_interactions"]
-            
-            # Update average rating if provided
-            if feedback_data.get("effectiveness_rating"):
-                current_avg = metrics.get("average_rating", 0) or 0
-                total_interactions = metrics["total_interactions"]
-                new_rating = feedback_data["effectiveness_rating"]
-                
-                if current_avg == 0:
-                    metrics["average_rating"] = new_rating
-                else:
-                    # Calculate running average
-                    metrics["average_rating"] = (
-                        (current_avg * (total_interactions - 1) + new_rating) / total_interactions
-                    )
-            
-            metrics["last_updated"] = datetime.utcnow()
-            
-            # Upsert metrics
             await self.db.recommendation_metrics.update_one(
                 {"recommendation_id": recommendation_id},
-                {"$set": metrics},
+                pipeline,
                 upsert=True
             )
             
@@ -571,7 +669,8 @@ class RecommendationEngineService:
     async def prioritize_recommendations_by_severity(
         self, 
         recommendations: List[Recommendation],
-        gap_analysis: Dict[str, Any]
+        gap_analysis: Dict[str, Any],
+        top_k: Optional[int] = None
     ) -> List[Recommendation]:
         """
         Prioritize recommendations based on gap severity
@@ -579,13 +678,14 @@ class RecommendationEngineService:
         Requirements: 3.2 - Severity-based recommendation prioritization
         """
         return await self.prioritization_service.prioritize_by_severity(
-            recommendations, gap_analysis
+            recommendations, gap_analysis, top_k=top_k
         )
     
     async def adapt_recommendations_by_progress(
         self, 
         student_id: str,
-        recommendations: List[Recommendation]
+        recommendations: List[Recommendation],
+        persist: bool = False
     ) -> List[Recommendation]:
         """
         Adapt recommendations based on student progress
@@ -593,7 +693,7 @@ class RecommendationEngineService:
         Requirements: 3.4 - Adaptive recommendation updates based on progress
         """
         return await self.prioritization_service.adapt_recommendations_by_progress(
-            student_id, recommendations
+            student_id, recommendations, persist
         )
     
     async def apply_resource_diversity(
@@ -1,11 +1,16 @@
 """
 Recommendation Prioritization and Adaptation Service
 """
+import asyncio
+import heapq
 import logging
-from typing import Dict, Any, List, Optional, Tuple
+from functools import lru_cache
+from typing import Dict, Any, Callable, List, Optional, Set, Tuple
 from datetime import datetime, timedelta
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
 import uuid
+import numpy as np
 
 from app.models.recommendations import (
     Recommendation, RecommendationRequest, DifficultyLevel, 
@@ -14,6 +19,39 @@ from app.models.recommendations import (
 
 logger = logging.getLogger(__name__)
 
+# Candidate lists longer than this are scored with NumPy instead of per-item arithmetic
+_VECTORIZE_THRESHOLD = 50
+
+# Performance fields read by the progress adaptation
+_RECENT_PERFORMANCE_PROJECTION = {
+    "_id": 0,
+    "score": 1,
+    "max_score": 1,
+    "timestamp": 1,
+    "metadata.concept_tags": 1,
+    "question_responses.concept_tags": 1
+}
+
+# Expected impact multiplier per resource type, other types use 1.0
+_IMPACT_MULTIPLIERS = {
+    ResourceType.INTERACTIVE: 1.2,
+    ResourceType.PROJECT: 1.3,
+    ResourceType.COURSE: 1.1,
+    ResourceType.VIDEO: 1.0,
+    ResourceType.ARTICLE: 0.9,
+    ResourceType.QUIZ: 0.8
+}
+
+
+# Accessibility features assumed to be supported by every resource (mock)
+_BASIC_ACCESSIBILITY_FEATURES = frozenset({"screen_reader", "keyboard_navigation", "high_contrast"})
+
+
+@lru_cache(maxsize=1024)
+def _is_accessibility_compatible(resource_features: frozenset, accessibility_reqs: frozenset) -> bool:
+    """Check that every non-basic required feature is supported by the resource"""
+    return (accessibility_reqs - _BASIC_ACCESSIBILITY_FEATURES) <= resource_features
+
 
 class RecommendationPrioritizationService:
     """Service for prioritizing and adapting recommendations"""
@@ -24,11 +62,14 @@ class RecommendationPrioritizationService:
     async def prioritize_by_severity(
         self, 
         recommendations: List[Recommendation],
-        gap_analysis: Dict[str, Any]
+        gap_analysis: Dict[str, Any],
+        top_k: Optional[int] = None
     ) -> List[Recommendation]:
         """
         Prioritize recommendations based on gap severity
         
+        When top_k is given only the k highest priority recommendations are returned.
+        
         Requirements: 3.2 - Severity-based recommendation prioritization
         """
         try:
@@ -37,21 +78,46 @@ class RecommendationPrioritizationService:
             # Get gap severity scores for each concept
             gap_severities = gap_analysis.get("gap_severities", {})
             
-            # Calculate priority scores based on gap severity
-            for rec in recommendations:
-                severity_score = self._calculate_severity_score(rec, gap_severities)
-                urgency_score = self._calculate_urgency_score(rec, gap_analysis)
-                impact_score = self._calculate_impact_score(rec)
-                
-                # Combine scores with weights
-                rec.priority_score = (
-                    severity_score * 0.4 +      # 40% weight for severity
-                    urgency_score * 0.3 +       # 30% weight for urgency
-                    impact_score * 0.3          # 30% weight for impact
-                )
+            # Materialize urgency factor lists once for O(1) membership checks
+            urgency_factors = gap_analysis.get("urgency_factors", {})
+            prerequisite_concepts = frozenset(urgency_factors.get("prerequisite_concepts", []))
+            upcoming_assessments = frozenset(urgency_factors.get("upcoming_assessments", []))
             
-            # Sort by priority score (highest first)
-            recommendations.sort(key=lambda x: x.priority_score, reverse=True)
+            if len(recommendations) > _VECTORIZE_THRESHOLD:
+                priority_scores = self._calculate_priority_scores_vectorized(
+                    recommendations, gap_severities, prerequisite_concepts, upcoming_assessments
+                )
+                
+                # Stable descending order, matching list.sort(reverse=True)
+                order = np.argsort(-priority_scores, kind="stable")
+                if top_k is not None:
+                    order = order[:top_k]
+                for rec, score in zip(recommendations, priority_scores.tolist()):
+                    rec.priority_score = score
+                recommendations = [recommendations[i] for i in order.tolist()]
+            else:
+                # Calculate priority scores based on gap severity
+                for rec in recommendations:
+                    severity_score = self._calculate_severity_score(rec, gap_severities)
+                    urgency_score = self._calculate_urgency_score(
+                        rec, prerequisite_concepts, upcoming_assessments
+                    )
+                    impact_score = self._calculate_impact_score(rec)
+                    
+                    # Combine scores with weights
+                    rec.priority_score = (
+                        severity_score * 0.4 +      # 40% weight for severity
+                        urgency_score * 0.3 +       # 30% weight for urgency
+                        impact_score * 0.3          # 30% weight for impact
+                    )
+                
+                # Sort by priority score (highest first), keeping only the top k if requested
+                if top_k is not None:
+                    recommendations = heapq.nlargest(
+                        top_k, recommendations, key=lambda x: x.priority_score
+                    )
+                else:
+                    recommendations.sort(key=lambda x: x.priority_score, reverse=True)
             
             logger.info("Recommendations prioritized by severity")
             return recommendations
@@ -63,21 +129,30 @@ class RecommendationPrioritizationService:
     async def adapt_recommendations_by_progress(
         self, 
         student_id: str,
-        recommendations: List[Recommendation]
+        recommendations: List[Recommendation],
+        persist: bool = False
     ) -> List[Recommendation]:
         """
         Adapt recommendations based on student progress
         
+        When persist is set, the adapted scores are written back to the stored
+        recommendations in a single bulk write.
+        
         Requirements: 3.4 - Adaptive recommendation updates based on progress
         """
         try:
             logger.info(f"Adapting recommendations for student {student_id}")
             
-            # Get recent student performance
-            recent_performance = await self._get_recent_performance(student_id)
+            # Get recent student performance and completed recommendations concurrently
+            recent_performance, completed_recs = await asyncio.gather(
+                self._get_recent_performance(student_id),
+                self._get_completed_recommendations(
+                    student_id, [rec.recommendation_id for rec in recommendations]
+                )
+            )
             
-            # Get completed recommendations
-            completed_recs = await self._get_completed_recommendations(student_id)
+            # Parse concept tags and score ratios of each performance record once
+            performance_concepts = self._extract_performance_concepts(recent_performance)
             
             # Adapt recommendations based on progress
             adapted_recs = []
@@ -89,7 +164,7 @@ class RecommendationPrioritizationService:
                 
                 # Adjust based on recent performance in related concepts
                 performance_adjustment = self._calculate_performance_adjustment(
-                    rec, recent_performance
+                    rec, performance_concepts
                 )
                 
                 # Adjust based on learning velocity
@@ -106,6 +181,9 @@ class RecommendationPrioritizationService:
                 
                 adapted_recs.append(rec)
             
+            if persist:
+                await self._persist_adapted_scores(adapted_recs)
+            
             logger.info(f"Adapted {len(adapted_recs)} recommendations")
             return adapted_recs
             
@@ -126,6 +204,13 @@ class RecommendationPrioritizationService:
         try:
             logger.info(f"Applying resource diversity with factor {diversity_factor}")
             
+            if len(recommendations) > _VECTORIZE_THRESHOLD:
+                diversified_recs = self._apply_resource_diversity_vectorized(
+                    recommendations, diversity_factor
+                )
+                logger.info("Resource diversity applied")
+                return diversified_recs
+            
             # Group recommendations by resource type
             type_groups = {}
             for rec in recommendations:
@@ -177,45 +262,12 @@ class RecommendationPrioritizationService:
         try:
             logger.info(f"Applying constraint filters: {list(constraints.keys())}")
             
-            filtered_recs = []
+            predicates = self._compile_constraint_predicates(constraints)
             
-            for rec in recommendations:
-                # Check time constraints
-                if "max_duration" in constraints:
-                    max_duration = constraints["max_duration"]
-                    if rec.resource.estimated_duration > max_duration:
-                        continue
-                
-                # Check difficulty constraints
-                if "difficulty_range" in constraints:
-                    difficulty_range = constraints["difficulty_range"]
-                    if rec.resource.difficulty_level not in difficulty_range:
-                        continue
-                
-                # Check prerequisite constraints
-                if "enforce_prerequisites" in constraints and constraints["enforce_prerequisites"]:
-                    if not rec.prerequisites_met:
-                        continue
-                
-                # Check resource type constraints
-                if "allowed_resource_types" in constraints:
-                    allowed_types = constraints["allowed_resource_types"]
-                    if rec.resource.resource_type not in allowed_types:
-                        continue
-                
-                # Check concept constraints
-                if "required_concepts" in constraints:
-                    required_concepts = constraints["required_concepts"]
-                    if not any(concept in rec.target_concepts for concept in required_concepts):
-                        continue
-                
-                # Check accessibility constraints
-                if "accessibility_requirements" in constraints:
-                    accessibility_reqs = constraints["accessibility_requirements"]
-                    if not self._check_accessibility_compatibility(rec, accessibility_reqs):
-                        continue
-                
-                filtered_recs.append(rec)
+            filtered_recs = [
+                rec for rec in recommendations
+                if all(predicate(rec) for predicate in predicates)
+            ]
             
             logger.info(f"Filtered to {len(filtered_recs)} recommendations after applying constraints")
             return filtered_recs
@@ -224,6 +276,148 @@ class RecommendationPrioritizationService:
             logger.error(f"Error applying constraint filters: {e}")
             return recommendations
     
+    def _apply_resource_diversity_vectorized(
+        self, 
+        recommendations: List[Recommendation],
+        diversity_factor: float
+    ) -> List[Recommendation]:
+        """Penalize over-represented resource types using per-type count and score arrays"""
+        total_recs = len(recommendations)
+        
+        # Type codes follow first appearance, matching the grouping order of the scalar path
+        type_code_map = {}
+        type_codes = np.fromiter(
+            (type_code_map.setdefault(rec.resource.resource_type, len(type_code_map)) for rec in recommendations),
+            dtype=np.intp,
+            count=total_recs
+        )
+        confidence_scores = np.fromiter(
+            (rec.confidence_score for rec in recommendations), dtype=np.float64, count=total_recs
+        )
+        
+        # Calculate diversity penalty for over-represented types
+        type_counts = np.bincount(type_codes).astype(np.float64)
+        ideal_per_type = total_recs / len(type_counts)
+        penalties = np.where(
+            type_counts > ideal_per_type,
+            np.maximum(0.5, 1.0 - diversity_factor * (type_counts - ideal_per_type) / ideal_per_type),
+            1.0
+        )
+        confidence_scores *= penalties[type_codes]
+        
+        for rec, score in zip(recommendations, confidence_scores.tolist()):
+            rec.confidence_score = score
+        
+        # Highest adjusted confidence first, ties keep type-group then original order
+        order = np.lexsort((type_codes, -confidence_scores))
+        return [recommendations[i] for i in order.tolist()]
+    
+    def _compile_constraint_predicates(
+        self, 
+        constraints: Dict[str, Any]
+    ) -> List[Callable[[Recommendation], bool]]:
+        """
+        Compile the active constraints into predicates a recommendation must satisfy
+        
+        Predicates are ordered cheapest first so all() rejects early.
+        """
+        predicates = []
+        
+        # Check time constraints
+        if "max_duration" in constraints:
+            max_duration = constraints["max_duration"]
+            predicates.append(lambda rec: rec.resource.estimated_duration <= max_duration)
+        
+        # Check difficulty constraints
+        if "difficulty_range" in constraints:
+            difficulty_range = frozenset(constraints["difficulty_range"])
+            predicates.append(lambda rec: rec.resource.difficulty_level in difficulty_range)
+        
+        # Check resource type constraints
+        if "allowed_resource_types" in constraints:
+            allowed_types = frozenset(constraints["allowed_resource_types"])
+            predicates.append(lambda rec: rec.resource.resource_type in allowed_types)
+        
+        # Check prerequisite constraints
+        if constraints.get("enforce_prerequisites"):
+            predicates.append(lambda rec: rec.prerequisites_met)
+        
+        # Check accessibility constraints
+        if "accessibility_requirements" in constraints:
+            accessibility_reqs = frozenset(constraints["accessibility_requirements"])
+            predicates.append(
+                lambda rec: self._check_accessibility_compatibility(rec, accessibility_reqs)
+            )
+        
+        # Check concept constraints
+        if "required_concepts" in constraints:
+            required_concepts = frozenset(constraints["required_concepts"])
+            predicates.append(lambda rec: not required_concepts.isdisjoint(rec.target_concepts))
+        
+        return predicates
+    
+    def _calculate_priority_scores_vectorized(
+        self, 
+        recommendations: List[Recommendation],
+        gap_severities: Dict[str, float],
+        prerequisite_concepts: frozenset,
+        upcoming_assessments: frozenset
+    ) -> np.ndarray:
+        """Calculate severity/urgency/impact priority scores for all recommendations at once"""
+        total_recs = len(recommendations)
+        
+        # Flatten target concepts so per-recommendation reductions run over segments
+        concept_counts = np.fromiter(
+            (len(rec.target_concepts) for rec in recommendations), dtype=np.int64, count=total_recs
+        )
+        concepts = [concept for rec in recommendations for concept in rec.target_concepts]
+        
+        severity_scores = np.zeros(total_recs)
+        urgency_scores = np.full(total_recs, 0.5)  # Base urgency
+        
+        if concepts:
+            concept_severities = np.fromiter(
+                (gap_severities.get(concept, 0.5) for concept in concepts),  # Default to medium severity
+                dtype=np.float64,
+                count=len(concepts)
+            )
+            concept_urgencies = np.fromiter(
+                (
+                    (0.2 if concept in prerequisite_concepts else 0.0) +
+                    (0.3 if concept in upcoming_assessments else 0.0)
+                    for concept in concepts
+                ),
+                dtype=np.float64,
+                count=len(concepts)
+            )
+            
+            # Segment start offsets, skipping recommendations without target concepts
+            has_concepts = concept_counts > 0
+            offsets = (np.cumsum(concept_counts) - concept_counts)[has_concepts]
+            
+            severity_scores[has_concepts] = np.maximum(
+                np.maximum.reduceat(concept_severities, offsets), 0.0
+            )
+            urgency_scores[has_concepts] += np.add.reduceat(concept_urgencies, offsets)
+        
+        # Base impact adjusted by resource characteristics
+        impact_scores = np.fromiter(
+            (rec.estimated_impact for rec in recommendations), dtype=np.float64, count=total_recs
+        )
+        impact_scores *= np.fromiter(
+            (_IMPACT_MULTIPLIERS.get(rec.resource.resource_type, 1.0) for rec in recommendations),
+            dtype=np.float64,
+            count=total_recs
+        )
+        
+        # Cap component scores in one pass each instead of per-element min()
+        np.clip(urgency_scores, 0.0, 1.0, out=urgency_scores)
+        np.clip(impact_scores, 0.0, 1.0, out=impact_scores)
+        
+        # 40% severity, 30% urgency, 30% impact
+        priority_scores = severity_scores * 0.4 + urgency_scores * 0.3 + impact_scores * 0.3
+        return np.clip(priority_scores, 0.0, 1.0, out=priority_scores)
+    
     def _calculate_severity_score(
         self, 
         rec: Recommendation, 
@@ -242,47 +436,59 @@ class RecommendationPrioritizationService:
     def _calculate_urgency_score(
         self, 
         rec: Recommendation, 
-        gap_analysis: Dict[str, Any]
+        prerequisite_concepts: frozenset,
+        upcoming_assessments: frozenset
     ) -> float:
-        """Calculate urgency score based on gap analysis"""
+        """Calculate urgency score based on gap analysis urgency factors"""
         # Factors that increase urgency:
         # - Concepts are prerequisites for other concepts
         # - Student is falling behind in related areas
         # - Upcoming assessments or deadlines
         
-        urgency_factors = gap_analysis.get("urgency_factors", {})
-        
         urgency_score = 0.5  # Base urgency
         
         for concept in rec.target_concepts:
             # Check if concept is a prerequisite for others
-            if concept in urgency_factors.get("prerequisite_concepts", []):
+            if concept in prerequisite_concepts:
                 urgency_score += 0.2
             
             # Check if concept has upcoming assessments
-            if concept in urgency_factors.get("upcoming_assessments", []):
+            if concept in upcoming_assessments:
                 urgency_score += 0.3
         
         return min(1.0, urgency_score)
     
     def _calculate_impact_score(self, rec: Recommendation) -> float:
         """Calculate expected impact score"""
-        # Base impact from recommendation
-        base_impact = rec.estimated_impact
-        
-        # Adjust based on resource characteristics
-        impact_multipliers = {
-            ResourceType.INTERACTIVE: 1.2,
-            ResourceType.PROJECT: 1.3,
-            ResourceType.COURSE: 1.1,
-            ResourceType.VIDEO: 1.0,
-            ResourceType.ARTICLE: 0.9,
-            ResourceType.QUIZ: 0.8
-        }
-        
-        multiplier = impact_multipliers.get(rec.resource.resource_type, 1.0)
-        
-        return min(1.0, base_impact * multiplier)
+        # Base impact adjusted by resource characteristics
+        multiplier = _IMPACT_MULTIPLIERS.get(rec.resource.resource_type, 1.0)
+        
+        return min(1.0, rec.estimated_impact * multiplier)
+    
+    async def _persist_adapted_scores(self, recommendations: List[Recommendation]) -> None:
+        """Write adapted priority/confidence scores back to stored recommendations"""
+        if not recommendations:
+            return
+        
+        try:
+            operations = [
+                UpdateOne(
+                    {"recommendation_id": rec.recommendation_id},
+                    {
+                        "$set": {
+                            "priority_score": rec.priority_score,
+                            "confidence_score": rec.confidence_score,
+                            "reasoning": rec.reasoning
+                        }
+                    }
+                )
+                for rec in recommendations
+            ]
+            
+            await self.db.recommendations.bulk_write(operations, ordered=False)
+            
+        except Exception as e:
+            logger.error(f"Error persisting adapted recommendation scores: {e}")
     
     async def _get_recent_performance(self, student_id: str) -> List[Dict[str, Any]]:
         """Get recent student performance data"""
@@ -290,10 +496,13 @@ class RecommendationPrioritizationService:
             # Get performance from last 30 days
             cutoff_date = datetime.utcnow() - timedelta(days=30)
             
-            cursor = self.db.student_performance.find({
-                "student_id": student_id,
-                "timestamp": {"$gte": cutoff_date}
-            }).sort("timestamp", -1)
+            cursor = self.db.student_performance.find(
+                {
+                    "student_id": student_id,
+                    "timestamp": {"$gte": cutoff_date}
+                },
+                _RECENT_PERFORMANCE_PROJECTION
+            ).sort("timestamp", -1)
             
             performance_data = await cursor.to_list(length=50)  # Last 50 submissions
             return performance_data
@@ -302,53 +511,118 @@ class RecommendationPrioritizationService:
             logger.error(f"Error getting recent performance: {e}")
             return []
     
-    async def _get_completed_recommendations(self, student_id: str) -> List[str]:
-        """Get list of completed recommendation IDs"""
+    async def _get_recent_performance_bulk(
+        self, 
+        student_ids: List[str]
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Get recent performance data for many students in a single aggregation"""
+        recent_performance = {student_id: [] for student_id in student_ids}
+        
+        if not student_ids:
+            return recent_performance
+        
+        try:
+            # Get performance from last 30 days
+            cutoff_date = datetime.utcnow() - timedelta(days=30)
+            
+            pipeline = [
+                {
+                    "$match": {
+                        "student_id": {"$in": student_ids},
+                        "timestamp": {"$gte": cutoff_date}
+                    }
+                },
+                {"$project": {**_RECENT_PERFORMANCE_PROJECTION, "student_id": 1}},
+                # $topN keeps only the last 50 submissions per student while grouping,
+                # so a busy student cannot push the group past its memory limit
+                {"$group": {
+                    "_id": "$student_id",
+                    "docs": {"$topN": {"n": 50, "sortBy": {"timestamp": -1}, "output": "$$ROOT"}}
+                }}
+            ]
+            
+            async for group in self.db.student_performance.aggregate(pipeline):
+                recent_performance[group["_id"]] = group["docs"]
+            
+            return recent_performance
+            
+        except Exception as e:
+            logger.error(f"Error getting recent performance for {len(student_ids)} students: {e}")
+            return recent_performance
+    
+    async def _get_completed_recommendations(
+        self, 
+        student_id: str,
+        rec_ids: Optional[List[str]] = None
+    ) -> Set[str]:
+        """Get set of completed recommendation IDs, limited to rec_ids when given"""
         try:
-            cursor = self.db.recommendation_feedback.find({
+            query = {
                 "student_id": student_id,
                 "completed": True
-            })
+            }
+            
+            if rec_ids is not None:
+                if not rec_ids:
+                    return set()
+                query["recommendation_id"] = {"$in": rec_ids}
+            
+            cursor = self.db.recommendation_feedback.find(
+                query,
+                {"recommendation_id": 1, "_id": 0}
+            )
             
             feedback_data = await cursor.to_list(length=None)
-            completed_ids = [feedback["recommendation_id"] for feedback in feedback_data]
+            completed_ids = {feedback["recommendation_id"] for feedback in feedback_data}
             
             return completed_ids
             
         except Exception as e:
             logger.error(f"Error getting completed recommendations: {e}")
-            return []
+            return set()
     
-    def _calculate_performance_adjustment(
+    def _extract_performance_concepts(
         self, 
-        rec: Recommendation, 
         recent_performance: List[Dict[str, Any]]
-    ) -> float:
-        """Calculate performance-based adjustment factor"""
-        if not recent_performance:
-            return 1.0
-        
-        # Calculate average performance in related concepts
-        related_performance = []
+    ) -> List[Tuple[frozenset, float]]:
+        """Extract (concept set, performance ratio) pairs from performance records"""
+        performance_concepts = []
         
         for perf in recent_performance:
-            # Check if performance involves concepts from this recommendation
-            perf_concepts = []
+            perf_concepts = set()
             
             if "metadata" in perf and "concept_tags" in perf["metadata"]:
-                perf_concepts.extend(perf["metadata"]["concept_tags"])
+                perf_concepts.update(perf["metadata"]["concept_tags"])
             
             if "question_responses" in perf:
                 for response in perf["question_responses"]:
                     if "concept_tags" in response:
-                        perf_concepts.extend(response["concept_tags"])
+                        perf_concepts.update(response["concept_tags"])
             
-            # Check for overlap with recommendation concepts
-            if any(concept in rec.target_concepts for concept in perf_concepts):
-                score = perf.get("score", 0)
-                max_score = perf.get("max_score", 1)
-                performance_ratio = score / max_score if max_score > 0 else 0
-                related_performance.append(performance_ratio)
+            score = perf.get("score", 0)
+            max_score = perf.get("max_score", 1)
+            performance_ratio = score / max_score if max_score > 0 else 0
+            
+            performance_concepts.append((frozenset(perf_concepts), performance_ratio))
+        
+        return performance_concepts
+    
+    def _calculate_performance_adjustment(
+        self, 
+        rec: Recommendation, 
+        performance_concepts: List[Tuple[frozenset, float]]
+    ) -> float:
+        """Calculate performance-based adjustment factor"""
+        if not performance_concepts:
+            return 1.0
+        
+        # Calculate average performance in related concepts
+        target_concepts = frozenset(rec.target_concepts)
+        related_performance = [
+            performance_ratio
+            for perf_concepts, performance_ratio in performance_concepts
+            if not perf_concepts.isdisjoint(target_concepts)
+        ]
         
         if not related_performance:
             return 1.0
@@ -391,17 +665,22 @@ class RecommendationPrioritizationService:
         # Calculate trend (simple linear regression slope)
         if len(performance_scores) >= 3:
             # Calculate slope of performance over time
-            x_values = [(score[0] - performance_scores[0][0]).total_seconds() for score in performance_scores]
-            y_values = [score[1] for score in performance_scores]
-            
-            n = len(x_values)
-            sum_x = sum(x_values)
-            sum_y = sum(y_values)
-            sum_xy = sum(x * y for x, y in zip(x_values, y_values))
-            sum_x2 = sum(x * x for x in x_values)
-            
-            if n * sum_x2 - sum_x * sum_x != 0:
-                slope = (n * sum_xy - sum_x * sum_y) / (n * sum_x2 - sum_x * sum_x)
+            n = len(performance_scores)
+            start_time = performance_scores[0][0]
+            x_values = np.fromiter(
+                ((timestamp - start_time).total_seconds() for timestamp, _ in performance_scores),
+                dtype=np.float64,
+                count=n
+            )
+            y_values = np.fromiter(
+                (ratio for _, ratio in performance_scores), dtype=np.float64, count=n
+            )
+            
+            x_centered = x_values - x_values.mean()
+            x_variance = np.dot(x_centered, x_centered)
+            
+            if x_variance != 0:
+                slope = np.dot(x_centered, y_values - y_values.mean()) / x_variance
                 
                 # Adjust priority based on learning velocity
                 if slope > 0:
@@ -414,19 +693,10 @@ class RecommendationPrioritizationService:
     def _check_accessibility_compatibility(
         self, 
         rec: Recommendation, 
-        accessibility_reqs: List[str]
+        accessibility_reqs: frozenset
     ) -> bool:
         """Check if recommendation meets accessibility requirements"""
         # Mock accessibility check - in production, this would check actual resource metadata
-        resource_accessibility = rec.resource.metadata.get("accessibility_features", [])
-        
-        # Check if all required accessibility features are supported
-        for req in accessibility_reqs:
-            if req not in resource_accessibility:
-                # For mock purposes, assume basic accessibility support
-                if req in ["screen_reader", "keyboard_navigation", "high_contrast"]:
-                    continue
-                else:
-                    return False
+        resource_accessibility = frozenset(rec.resource.metadata.get("accessibility_features", []))
         
-        return True
\ No newline at end of file
+        return _is_accessibility_compatible(resource_accessibility, accessibility_reqs)
@@ -2,9 +2,14 @@
 Recommendation Service
 Handles personalized learning recommendations
 """
-from typing import Dict, Any, List
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
+from bson import ObjectId
 from app.core.database import get_database
+from contextlib import asynccontextmanager
+import asyncio
+import copy
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -14,32 +19,90 @@ class RecommendationService:
     
     def __init__(self):
         self.collection_name = "recommendations"
-    
-    async def get_recommendations(self, student_id: str) -> List[Dict[str, Any]]:
-        """Get personalized recommendations for a student"""
-        db = await get_database()
-        collection = db[self.collection_name]
+        self._db = None
         
-        cursor = collection.find({"student_id": student_id}).sort("priority_score", -1)
-        recommendations = []
+        # Process-local cache of recent reads: student_id -> {limit: (expires_at, docs)}
+        self.cache_ttl = 60  # 1 minute cache
+        self.max_cache_size = 10000  # Maximum number of cached students
+        self._cache: Dict[str, Dict[int, Tuple[float, List[Dict[str, Any]]]]] = {}
+        # student_id -> [lock, number of readers holding or waiting on it]
+        self._cache_locks: Dict[str, List[Any]] = {}
+    
+    async def _get_collection(self):
+        """Get the recommendations collection, resolving the database handle once"""
+        if self._db is None:
+            self._db = await get_database()
+        return self._db[self.collection_name]
+    
+    async def get_recommendations(self, student_id: str, limit: int = 200) -> List[Dict[str, Any]]:
+        """Get personalized recommendations for a student, highest priority first"""
+        cached = self._get_cached(student_id, limit)
+        if cached is not None:
+            return cached
         
-        async for doc in cursor:
-            doc["_id"] = str(doc["_id"])
-            recommendations.append(doc)
+        # Concurrent misses for the same student share a single query
+        async with self._student_lock(student_id):
+            cached = self._get_cached(student_id, limit)
+            if cached is not None:
+                return cached
+            
+            collection = await self._get_collection()
+            
+            cursor = collection.find({"student_id": student_id}).sort("priority_score", -1)
+            recommendations = await cursor.to_list(length=limit)
+            
+            for doc in recommendations:
+                doc["_id"] = str(doc["_id"])
+            
+            self._set_cached(student_id, limit, recommendations)
         
-        return recommendations
+        return copy.deepcopy(recommendations)
+    
+    @asynccontextmanager
+    async def _student_lock(self, student_id: str) -> AsyncIterator[None]:
+        """Hold the student's cache lock, dropping it from the lock map once no one holds or waits on it"""
+        lock_entry = self._cache_locks.setdefault(student_id, [asyncio.Lock(), 0])
+        lock_entry[1] += 1
+        try:
+            async with lock_entry[0]:
+                yield
+        finally:
+            lock_entry[1] -= 1
+            if not lock_entry[1]:
+                del self._cache_locks[student_id]
     
     async def complete_recommendation(self, student_id: str, recommendation_id: str) -> bool:
         """Mark a recommendation as completed"""
-        db = await get_database()
-        collection = db[self.collection_name]
+        collection = await self._get_collection()
+        
+        # Ids handed out by get_recommendations are stringified ObjectIds, so convert
+        # them back to hit the _id index instead of never matching
+        document_id = ObjectId(recommendation_id) if ObjectId.is_valid(recommendation_id) else recommendation_id
         
         result = await collection.update_one(
-            {"_id": recommendation_id, "student_id": student_id},
+            {"_id": document_id, "student_id": student_id},
             {"$set": {"completed": True}}
         )
         
+        # Drop cached reads so the completion is visible immediately; the lock waits out a
+        # read already in flight so it cannot cache pre-completion documents afterwards
+        async with self._student_lock(student_id):
+            self._cache.pop(student_id, None)
+        
         return result.modified_count > 0
+    
+    def _get_cached(self, student_id: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Get deep copies of unexpired cached recommendations so callers cannot mutate the cache"""
+        entry = self._cache.get(student_id, {}).get(limit)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return copy.deepcopy(entry[1])
+    
+    def _set_cached(self, student_id: str, limit: int, recommendations: List[Dict[str, Any]]) -> None:
+        """Cache recommendations, evicting the oldest student when full"""
+        if student_id not in self._cache and len(self._cache) >= self.max_cache_size:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache.setdefault(student_id, {})[limit] = (time.monotonic() + self.cache_ttl, recommendations)
 
 
 # Create service instance
@@ -2,17 +2,27 @@
 Security Management Service
 Handles role-based access control, security event logging, and data privacy controls
 """
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional
+import uuid
+from typing import Dict, Any, List, Optional, Set
 from datetime import datetime, timedelta
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from fastapi import HTTPException, status
 from app.models.user import UserRole
+from app.core.batch_writer import BatchWriter
 from app.core.redis_client import cache_manager
 from enum import Enum
 
 logger = logging.getLogger(__name__)
 
+# Sliding windows over which repeated failed logins and unauthorized access are counted
+_FAILED_LOGIN_WINDOW_SECONDS = 900
+_UNAUTHORIZED_ACCESS_WINDOW_SECONDS = 600
+
+# A session's last_activity is written at most once per interval
+_SESSION_ACTIVITY_WRITE_INTERVAL_SECONDS = 60
+
 
 class SecurityEventType(Enum):
     """Security event types for logging"""
@@ -27,6 +37,10 @@ class SecurityEventType(Enum):
     DATA_DELETION_REQUEST = "data_deletion_request"
 
 
+# Stored value of each event type, looked up without going through the Enum value descriptor
+_EVENT_TYPE_VALUES = {event_type: event_type.value for event_type in SecurityEventType}
+
+
 class FeaturePermission(Enum):
     """Feature permissions for role-based access control"""
     # Student permissions
@@ -52,44 +66,65 @@ class FeaturePermission(Enum):
     SYSTEM_CONFIGURATION = "system_configuration"
 
 
+# Role-based permissions as frozensets for constant-time membership checks; each role
+# includes the permissions of the roles below it
+_STUDENT_PERMISSIONS = frozenset({
+    FeaturePermission.VIEW_OWN_DASHBOARD,
+    FeaturePermission.VIEW_OWN_PERFORMANCE,
+    FeaturePermission.VIEW_OWN_RECOMMENDATIONS,
+    FeaturePermission.UPDATE_OWN_PROFILE,
+    FeaturePermission.REQUEST_DATA_EXPORT,
+    FeaturePermission.REQUEST_DATA_DELETION,
+})
+_ROLE_PERMISSIONS = {
+    UserRole.STUDENT: _STUDENT_PERMISSIONS,
+    UserRole.INSTRUCTOR: _STUDENT_PERMISSIONS | {
+        FeaturePermission.VIEW_STUDENT_ANALYTICS,
+        FeaturePermission.VIEW_CLASS_PERFORMANCE,
+        FeaturePermission.MANAGE_ASSIGNMENTS,
+        FeaturePermission.VIEW_LEARNING_GAPS,
+        FeaturePermission.GENERATE_REPORTS,
+    },
+    UserRole.ADMIN: frozenset(FeaturePermission)
+}
+
+# Permissions scoped to the user's own data, and the roles allowed to use them on other users' data
+_OWN_DATA_PERMISSIONS = frozenset({
+    FeaturePermission.VIEW_OWN_DASHBOARD,
+    FeaturePermission.VIEW_OWN_PERFORMANCE,
+    FeaturePermission.VIEW_OWN_RECOMMENDATIONS,
+    FeaturePermission.UPDATE_OWN_PROFILE
+})
+_ELEVATED_ROLES = frozenset({UserRole.INSTRUCTOR, UserRole.ADMIN})
+
+# Severity of each security event type; unlisted types are LOW
+_EVENT_SEVERITIES = {
+    SecurityEventType.UNAUTHORIZED_ACCESS: "HIGH",
+    SecurityEventType.DATA_ACCESS_VIOLATION: "HIGH",
+    SecurityEventType.ROLE_ESCALATION_ATTEMPT: "HIGH",
+    SecurityEventType.SUSPICIOUS_ACTIVITY: "HIGH",
+    SecurityEventType.FAILED_LOGIN: "MEDIUM",
+    SecurityEventType.INVALID_TOKEN: "MEDIUM",
+    SecurityEventType.RATE_LIMIT_EXCEEDED: "MEDIUM"
+}
+
+
 class SecurityService:
     """Service for security management and access control"""
     
+    # Shared buffer for events logged with buffered=True
+    _event_writer = BatchWriter("security events")
+    
+    # Suspicious activity checks running detached from buffered events; referenced until done
+    _pending_checks: Set[asyncio.Task] = set()
+    
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
         self.security_events_collection = db.security_events
         self.user_sessions_collection = db.user_sessions
         
         # Role-based permissions mapping
-        self.role_permissions = {
-            UserRole.STUDENT: [
-                FeaturePermission.VIEW_OWN_DASHBOARD,
-                FeaturePermission.VIEW_OWN_PERFORMANCE,
-                FeaturePermission.VIEW_OWN_RECOMMENDATIONS,
-                FeaturePermission.UPDATE_OWN_PROFILE,
-                FeaturePermission.REQUEST_DATA_EXPORT,
-                FeaturePermission.REQUEST_DATA_DELETION,
-            ],
-            UserRole.INSTRUCTOR: [
-                # Include all student permissions
-                FeaturePermission.VIEW_OWN_DASHBOARD,
-                FeaturePermission.VIEW_OWN_PERFORMANCE,
-                FeaturePermission.VIEW_OWN_RECOMMENDATIONS,
-                FeaturePermission.UPDATE_OWN_PROFILE,
-                FeaturePermission.REQUEST_DATA_EXPORT,
-                FeaturePermission.REQUEST_DATA_DELETION,
-                # Additional instructor permissions
-                FeaturePermission.VIEW_STUDENT_ANALYTICS,
-                FeaturePermission.VIEW_CLASS_PERFORMANCE,
-                FeaturePermission.MANAGE_ASSIGNMENTS,
-                FeaturePermission.VIEW_LEARNING_GAPS,
-                FeaturePermission.GENERATE_REPORTS,
-            ],
-            UserRole.ADMIN: [
-                # Include all permissions
-                permission for permission in FeaturePermission
-            ]
-        }
+        self.role_permissions = _ROLE_PERMISSIONS
     
     async def check_feature_access(
         self, 
@@ -109,7 +144,7 @@ class SecurityService:
         """
         try:
             # Get permissions for user role
-            user_permissions = self.role_permissions.get(user_role, [])
+            user_permissions = self.role_permissions.get(user_role, frozenset())
             
             # Check if user has the required permission
             if required_permission not in user_permissions:
@@ -126,15 +161,10 @@ class SecurityService:
             
             # For data access permissions, ensure user can only access their own data
             # unless they have elevated privileges
-            if required_permission in [
-                FeaturePermission.VIEW_OWN_DASHBOARD,
-                FeaturePermission.VIEW_OWN_PERFORMANCE,
-                FeaturePermission.VIEW_OWN_RECOMMENDATIONS,
-                FeaturePermission.UPDATE_OWN_PROFILE
-            ]:
+            if required_permission in _OWN_DATA_PERMISSIONS:
                 if resource_owner_id and resource_owner_id != user_id:
                     # Check if user has elevated privileges
-                    if user_role not in [UserRole.INSTRUCTOR, UserRole.ADMIN]:
+                    if user_role not in _ELEVATED_ROLES:
                         await self.log_security_event(
                             event_type=SecurityEventType.DATA_ACCESS_VIOLATION,
                             user_id=user_id,
@@ -177,12 +207,19 @@ class SecurityService:
         user_id: Optional[str] = None,
         ip_address: Optional[str] = None,
         user_agent: Optional[str] = None,
-        details: Optional[Dict[str, Any]] = None
+        details: Optional[Dict[str, Any]] = None,
+        buffered: bool = False
     ) -> None:
-        """Log security events for monitoring and auditing"""
+        """
+        Log security events for monitoring and auditing
+        
+        Buffered events are batch inserted shortly after and checked for suspicious
+        patterns in the background, so the caller does not wait on either.
+        """
         try:
+            event_type_value = _EVENT_TYPE_VALUES[event_type]
             security_event = {
-                "event_type": event_type.value,
+                "event_type": event_type_value,
                 "user_id": user_id,
                 "ip_address": ip_address,
                 "user_agent": user_agent,
@@ -192,41 +229,52 @@ class SecurityService:
             }
             
             # Store in database
-            await self.security_events_collection.insert_one(security_event)
+            if buffered:
+                await self._enqueue_security_event(security_event)
+            else:
+                await self.security_events_collection.insert_one(security_event)
             
             # Log to application logger
             logger.warning(
-                f"Security Event: {event_type.value} - User: {user_id} - "
-                f"IP: {ip_address} - Details: {details}"
+                "Security Event: %s - User: %s - IP: %s - Details: %s",
+                event_type_value, user_id, ip_address, details
             )
             
             # Check for suspicious patterns
-            await self._check_suspicious_activity(user_id, event_type, ip_address)
+            if buffered:
+                cls = type(self)
+                check = asyncio.create_task(self._check_suspicious_activity(user_id, event_type, ip_address))
+                cls._pending_checks.add(check)
+                check.add_done_callback(cls._pending_checks.discard)
+            else:
+                await self._check_suspicious_activity(user_id, event_type, ip_address)
             
         except Exception as e:
             logger.error(f"Error logging security event: {e}")
     
+    async def _enqueue_security_event(self, event: Dict[str, Any]) -> None:
+        """Queue a security event for the shared batch writer"""
+        await type(self)._event_writer.put(event, self._write_security_events)
+    
+    async def _write_security_events(self, batch: List[Dict[str, Any]]) -> None:
+        """Write a batch of buffered security events"""
+        await self.security_events_collection.insert_many(batch, ordered=False)
+    
+    @classmethod
+    async def flush_buffered_events(cls, timeout: float = 5.0) -> None:
+        """Wait for pending suspicious activity checks and buffered event writes, then stop the batch writer"""
+        loop = asyncio.get_running_loop()
+        pending_checks = [check for check in cls._pending_checks if check.get_loop() is loop]
+        if pending_checks:
+            _, still_pending = await asyncio.wait(pending_checks, timeout=timeout)
+            if still_pending:
+                logger.warning("Timed out waiting for %d suspicious activity checks", len(still_pending))
+        
+        await cls._event_writer.flush(timeout)
+    
     def _get_event_severity(self, event_type: SecurityEventType) -> str:
         """Get severity level for security event"""
-        high_severity_events = [
-            SecurityEventType.UNAUTHORIZED_ACCESS,
-            SecurityEventType.DATA_ACCESS_VIOLATION,
-            SecurityEventType.ROLE_ESCALATION_ATTEMPT,
-            SecurityEventType.SUSPICIOUS_ACTIVITY
-        ]
-        
-        medium_severity_events = [
-            SecurityEventType.FAILED_LOGIN,
-            SecurityEventType.INVALID_TOKEN,
-            SecurityEventType.RATE_LIMIT_EXCEEDED
-        ]
-        
-        if event_type in high_severity_events:
-            return "HIGH"
-        elif event_type in medium_severity_events:
-            return "MEDIUM"
-        else:
-            return "LOW"
+        return _EVENT_SEVERITIES.get(event_type, "LOW")
     
     async def _check_suspicious_activity(
         self,
@@ -250,6 +298,33 @@ class SecurityService:
         except Exception as e:
             logger.error(f"Error checking suspicious activity: {e}")
     
+    async def _count_recent_events(
+        self,
+        event_type: SecurityEventType,
+        user_id: Optional[str],
+        ip_address: Optional[str],
+        window_seconds: int
+    ) -> int:
+        """Count the user's (or IP's) recent events of a type in a Redis sliding window, falling back to MongoDB"""
+        subject = f"user:{user_id}" if user_id else f"ip:{ip_address}"
+        window_size = await cache_manager.add_to_sliding_window(
+            f"{_EVENT_TYPE_VALUES[event_type]}:{subject}", uuid.uuid4().hex, window_seconds
+        )
+        if window_size is not None:
+            return window_size
+        
+        query = {
+            "event_type": _EVENT_TYPE_VALUES[event_type],
+            "timestamp": {"$gte": datetime.utcnow() - timedelta(seconds=window_seconds)}
+        }
+        
+        if user_id:
+            query["user_id"] = user_id
+        elif ip_address:
+            query["ip_address"] = ip_address
+        
+        return await self.security_events_collection.count_documents(query)
+    
     async def _check_failed_login_pattern(
         self,
         user_id: Optional[str],
@@ -257,22 +332,9 @@ class SecurityService:
     ) -> None:
         """Check for suspicious failed login patterns"""
         try:
-            # Check last 15 minutes
-            cutoff_time = datetime.utcnow() - timedelta(minutes=15)
-            
-            # Build query
-            query = {
-                "event_type": SecurityEventType.FAILED_LOGIN.value,
-                "timestamp": {"$gte": cutoff_time}
-            }
-            
-            if user_id:
-                query["user_id"] = user_id
-            elif ip_address:
-                query["ip_address"] = ip_address
-            
-            # Count failed attempts
-            failed_attempts = await self.security_events_collection.count_documents(query)
+            failed_attempts = await self._count_recent_events(
+                SecurityEventType.FAILED_LOGIN, user_id, ip_address, _FAILED_LOGIN_WINDOW_SECONDS
+            )
             
             # If more than 5 failed attempts, log suspicious activity
             if failed_attempts >= 5:
@@ -287,13 +349,9 @@ class SecurityService:
                     }
                 )
                 
-                # Cache the suspicious IP/user for rate limiting
+                # Cache the suspicious IP/user for rate limiting; the key expires when the block ends
                 if ip_address:
-                    await cache_manager.set_cache(
-                        f"suspicious_ip:{ip_address}",
-                        {"blocked_until": (datetime.utcnow() + timedelta(hours=1)).isoformat()},
-                        expire=3600
-                    )
+                    await cache_manager.set_cache(f"suspicious_ip:{ip_address}", "1", expire=3600)
                 
         except Exception as e:
             logger.error(f"Error checking failed login pattern: {e}")
@@ -305,20 +363,9 @@ class SecurityService:
     ) -> None:
         """Check for suspicious unauthorized access patterns"""
         try:
-            # Check last 10 minutes
-            cutoff_time = datetime.utcnow() - timedelta(minutes=10)
-            
-            query = {
-                "event_type": SecurityEventType.UNAUTHORIZED_ACCESS.value,
-                "timestamp": {"$gte": cutoff_time}
-            }
-            
-            if user_id:
-                query["user_id"] = user_id
-            elif ip_address:
-                query["ip_address"] = ip_address
-            
-            unauthorized_attempts = await self.security_events_collection.count_documents(query)
+            unauthorized_attempts = await self._count_recent_events(
+                SecurityEventType.UNAUTHORIZED_ACCESS, user_id, ip_address, _UNAUTHORIZED_ACCESS_WINDOW_SECONDS
+            )
             
             # If more than 3 unauthorized attempts, log suspicious activity
             if unauthorized_attempts >= 3:
@@ -339,11 +386,7 @@ class SecurityService:
     async def is_ip_suspicious(self, ip_address: str) -> bool:
         """Check if IP address is marked as suspicious"""
         try:
-            suspicious_data = await cache_manager.get_cache(f"suspicious_ip:{ip_address}")
-            if suspicious_data:
-                blocked_until = datetime.fromisoformat(suspicious_data["blocked_until"])
-                return datetime.utcnow() < blocked_until
-            return False
+            return await cache_manager.cache_exists(f"suspicious_ip:{ip_address}")
         except Exception as e:
             logger.error(f"Error checking suspicious IP {ip_address}: {e}")
             return False
@@ -372,13 +415,15 @@ class SecurityService:
                 "last_activity": datetime.utcnow()
             }
             
-            await self.user_sessions_collection.insert_one(session_data)
-            
-            # Cache session for quick lookup
-            await cache_manager.set_cache(
-                f"session:{session_token}",
-                session_data,
-                expire=int((expires_at - datetime.utcnow()).total_seconds())
+            # Store the session and cache it for quick lookup concurrently; the insert gets a
+            # copy because the driver adds _id to the document it writes
+            await asyncio.gather(
+                self.user_sessions_collection.insert_one(dict(session_data)),
+                cache_manager.set_cache(
+                    f"session:{session_token}",
+                    session_data,
+                    expire=int((expires_at - datetime.utcnow()).total_seconds())
+                )
             )
             
         except Exception as e:
@@ -399,11 +444,18 @@ class SecurityService:
                 })
             
             if session_data:
-                # Update last activity
-                await self.user_sessions_collection.update_one(
-                    {"session_token": session_token},
-                    {"$set": {"last_activity": datetime.utcnow()}}
+                # Update last activity unless it was written within the interval; write anyway if Redis is down
+                now = datetime.utcnow()
+                activity_claimed = await cache_manager.set_if_not_exists(
+                    f"session_activity:{session_token}",
+                    now.isoformat(),
+                    expire=_SESSION_ACTIVITY_WRITE_INTERVAL_SECONDS
                 )
+                if activity_claimed is not False:
+                    await self.user_sessions_collection.update_one(
+                        {"session_token": session_token},
+                        {"$set": {"last_activity": now}}
+                    )
                 
                 return session_data
             
@@ -467,7 +519,7 @@ class SecurityService:
             return []
     
     async def cleanup_expired_sessions(self) -> int:
-        """Clean up expired sessions"""
+        """Clean up expired sessions not yet removed by the expires_at TTL index"""
         try:
             result = await self.user_sessions_collection.delete_many({
                 "expires_at": {"$lt": datetime.utcnow()}
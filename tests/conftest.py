@@ -77,7 +77,10 @@ def setup_test_database():
     # Mock collections with proper async methods
     collections = [
         "user_profiles", "student_performance", "learning_gaps", 
-        "recommendations", "test_connection", "test_concurrent"
+        "recommendations", "recommendation_metrics", "recommendation_feedback",
+        "users", "security_events", "security_alerts", "compliance_violations",
+        "user_activity_stats", "user_sessions",
+        "test_connection", "test_concurrent"
     ]
     
     for collection_name in collections:
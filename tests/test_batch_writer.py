@@ -0,0 +1,35 @@
+"""
+Tests for the shared batched document writer
+"""
+import pytest
+from unittest.mock import AsyncMock
+
+from app.core.batch_writer import BatchWriter
+
+
+@pytest.mark.asyncio
+async def test_queued_documents_are_written_in_batches_up_to_the_size_limit():
+    """Test documents queued together are split into batches of at most max_batch_size"""
+    writer = BatchWriter("test documents", max_batch_size=2)
+    write_batch = AsyncMock()
+
+    for index in range(5):
+        await writer.put({"index": index}, write_batch)
+    await writer.flush()
+
+    batches = [call[0][0] for call in write_batch.call_args_list]
+    assert [[document["index"] for document in batch] for batch in batches] == [[0, 1], [2, 3], [4]]
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_write_does_not_stop_the_writer():
+    """Test a failing batch is logged and later batches are still written"""
+    writer = BatchWriter("test documents", max_batch_size=1)
+    write_batch = AsyncMock(side_effect=[RuntimeError("connection reset"), None])
+
+    await writer.put({"index": 0}, write_batch)
+    await writer.put({"index": 1}, write_batch)
+    await writer.flush()
+
+    assert write_batch.call_count == 2
+    assert writer._task is None
@@ -0,0 +1,170 @@
+"""
+Tests for the recommendation engine service
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.models.recommendations import (
+    Recommendation, RecommendationRequest, RecommendationType, LearningResource,
+    StudentPreferences, LearningStyle, DifficultyLevel, ResourceType
+)
+from app.services import recommendation_engine_service
+from app.services.recommendation_engine_service import RecommendationEngineService
+
+
+@pytest.fixture
+def mock_db():
+    """Create a mock database for testing"""
+    db = MagicMock()
+
+    db.recommendation_metrics = AsyncMock()
+    db.recommendation_metrics.find_one = AsyncMock(return_value=None)
+    db.recommendation_metrics.update_one = AsyncMock()
+
+    db.recommendation_feedback = AsyncMock()
+    db.recommendation_feedback.insert_one = AsyncMock()
+
+    return db
+
+
+@pytest.fixture
+def recommendation_service(mock_db):
+    """Create a recommendation engine service instance for testing"""
+    return RecommendationEngineService(mock_db)
+
+
+@pytest.mark.asyncio
+async def test_update_recommendation_metrics_is_single_atomic_update(recommendation_service, mock_db):
+    """Test metrics are updated with one pipeline upsert and no prior read"""
+
+    await recommendation_service._update_recommendation_metrics(
+        "rec_123",
+        {"student_id": "student_123", "completed": True, "effectiveness_rating": 4}
+    )
+
+    mock_db.recommendation_metrics.find_one.assert_not_called()
+    mock_db.recommendation_metrics.update_one.assert_called_once()
+
+    call_args = mock_db.recommendation_metrics.update_one.call_args
+    query, pipeline = call_args[0]
+
+    assert query == {"recommendation_id": "rec_123"}
+    assert call_args[1]["upsert"] is True
+    assert isinstance(pipeline, list)
+
+    counters = pipeline[0]["$set"]
+    assert counters["total_interactions"] == {"$add": [{"$ifNull": ["$total_interactions", 0]}, 1]}
+    assert counters["successful_completions"]["$add"][1] == 1
+
+    derived = pipeline[1]["$set"]
+    assert derived["completion_rate"] == {"$divide": ["$successful_completions", "$total_interactions"]}
+    assert "$cond" in derived["average_rating"]
+
+
+@pytest.mark.asyncio
+async def test_update_recommendation_metrics_without_rating_keeps_average(recommendation_service, mock_db):
+    """Test feedback without a rating leaves the stored average untouched"""
+
+    await recommendation_service._update_recommendation_metrics(
+        "rec_123",
+        {"student_id": "student_123", "completed": False}
+    )
+
+    pipeline = mock_db.recommendation_metrics.update_one.call_args[0][1]
+
+    assert pipeline[0]["$set"]["successful_completions"]["$add"][1] == 0
+    assert pipeline[1]["$set"]["average_rating"] == {"$ifNull": ["$average_rating", None]}
+
+
+def test_merge_preferences_returns_request_when_nothing_to_merge(recommendation_service):
+    """Test a fully specified request is returned unchanged"""
+
+    request = RecommendationRequest(
+        student_id="student_123",
+        learning_style=LearningStyle.VISUAL,
+        difficulty_preference=DifficultyLevel.BEGINNER,
+        time_available=30,
+        resource_types=[ResourceType.VIDEO]
+    )
+    stored_prefs = StudentPreferences(student_id="student_123", learning_style=LearningStyle.KINESTHETIC)
+
+    assert recommendation_service._merge_preferences(request, stored_prefs) is request
+
+
+def test_merge_preferences_fills_missing_fields_from_stored_preferences(recommendation_service):
+    """Test missing request fields fall back to stored preferences"""
+
+    request = RecommendationRequest(student_id="student_123", time_available=45)
+    stored_prefs = StudentPreferences(
+        student_id="student_123",
+        learning_style=LearningStyle.VISUAL,
+        preferred_resource_types=[ResourceType.VIDEO],
+        study_time_preference=90
+    )
+
+    merged = recommendation_service._merge_preferences(request, stored_prefs)
+
+    assert merged is not request
+    assert merged.learning_style == LearningStyle.VISUAL
+    assert merged.difficulty_preference == DifficultyLevel.INTERMEDIATE
+    assert merged.resource_types == [ResourceType.VIDEO]
+    assert merged.time_available == 45
+    assert request.learning_style is None
+
+
+@pytest.mark.asyncio
+async def test_update_recommendation_feedback_stores_feedback_and_metrics(recommendation_service, mock_db):
+    """Test feedback is stored and metrics are updated"""
+
+    result = await recommendation_service.update_recommendation_feedback(
+        "rec_123",
+        {"student_id": "student_123", "completed": True, "effectiveness_rating": 5}
+    )
+
+    assert result is True
+
+    mock_db.recommendation_feedback.insert_one.assert_called_once()
+    feedback_record = mock_db.recommendation_feedback.insert_one.call_args[0][0]
+    assert feedback_record["recommendation_id"] == "rec_123"
+    assert feedback_record["effectiveness_rating"] == 5
+
+    mock_db.recommendation_metrics.update_one.assert_called_once()
+
+
+def make_recommendation(index: int, priority_score: float, confidence_score: float, estimated_duration: int = 30):
+    """Create a recommendation for testing"""
+    return Recommendation(
+        recommendation_id=f"rec_{index}",
+        student_id="student_123",
+        resource=LearningResource(
+            resource_id=f"res_{index}",
+            title=f"Resource {index}",
+            description="Test resource",
+            resource_type=ResourceType.VIDEO,
+            difficulty_level=DifficultyLevel.BEGINNER,
+            estimated_duration=estimated_duration
+        ),
+        recommendation_type=RecommendationType.LEARNING_RESOURCE,
+        confidence_score=confidence_score,
+        priority_score=priority_score,
+        reasoning="Test reasoning",
+        prerequisites_met=True,
+        estimated_impact=0.5
+    )
+
+
+def test_combine_recommendations_shortlists_filtered_candidates_by_priority(recommendation_service, monkeypatch):
+    """Test the shortlist drops filtered-out candidates and ranks by priority before confidence"""
+
+    monkeypatch.setattr(recommendation_engine_service, "_CANDIDATE_SHORTLIST_SIZE", 2)
+    request = RecommendationRequest(student_id="student_123", time_available=30)
+    content_based_recs = [
+        make_recommendation(0, priority_score=0.9, confidence_score=1.0, estimated_duration=90),
+        make_recommendation(1, priority_score=0.2, confidence_score=1.0),
+        make_recommendation(2, priority_score=0.8, confidence_score=0.2),
+        make_recommendation(3, priority_score=0.8, confidence_score=0.4)
+    ]
+
+    shortlist = recommendation_service._combine_recommendations([], content_based_recs, request)
+
+    assert [rec.recommendation_id for rec in shortlist] == ["rec_3", "rec_2"]
@@ -0,0 +1,221 @@
+"""
+Tests for recommendation prioritization and adaptation
+"""
+import copy
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+from pymongo import UpdateOne
+
+from app.models.recommendations import (
+    Recommendation, LearningResource, RecommendationType, ResourceType, DifficultyLevel
+)
+from app.services import recommendation_prioritization_service
+from app.services.recommendation_prioritization_service import RecommendationPrioritizationService
+
+
+def make_recommendation(index: int, target_concepts, resource_type=ResourceType.VIDEO, estimated_impact=0.5):
+    """Create a recommendation for testing"""
+    return Recommendation(
+        recommendation_id=f"rec_{index}",
+        student_id="student_123",
+        resource=LearningResource(
+            resource_id=f"res_{index}",
+            title=f"Resource {index}",
+            description="Test resource",
+            resource_type=resource_type,
+            difficulty_level=DifficultyLevel.BEGINNER,
+            estimated_duration=30
+        ),
+        recommendation_type=RecommendationType.LEARNING_RESOURCE,
+        confidence_score=0.5,
+        priority_score=0.5,
+        reasoning="Test reasoning",
+        target_concepts=target_concepts,
+        prerequisites_met=True,
+        estimated_impact=estimated_impact
+    )
+
+
+def mock_cursor(documents):
+    """Create a mock Motor cursor returning the given documents"""
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.to_list = AsyncMock(return_value=documents)
+    return cursor
+
+
+@pytest.fixture
+def mock_db():
+    """Create a mock database for testing"""
+    db = MagicMock()
+    db.student_performance = MagicMock()
+    db.recommendation_feedback = MagicMock()
+    db.recommendations = MagicMock()
+    db.recommendations.bulk_write = AsyncMock()
+    return db
+
+
+@pytest.fixture
+def prioritization_service(mock_db):
+    """Create a prioritization service instance for testing"""
+    return RecommendationPrioritizationService(mock_db)
+
+
+@pytest.mark.asyncio
+async def test_prioritize_by_severity_vectorized_matches_scalar(prioritization_service, monkeypatch):
+    """Test large candidate lists are scored and ordered exactly like the scalar path"""
+    concept_pool = ["loops", "functions", "oop", "recursion", "sorting"]
+    resource_types = list(ResourceType)
+    recommendations = [
+        make_recommendation(
+            i,
+            concept_pool[i % 5:i % 5 + i % 3],
+            resource_type=resource_types[i % len(resource_types)],
+            estimated_impact=(i % 10) / 10
+        )
+        for i in range(120)
+    ]
+    gap_analysis = {
+        "gap_severities": {"loops": 0.9, "functions": 0.3, "recursion": 0.7},
+        "urgency_factors": {
+            "prerequisite_concepts": ["loops", "oop"],
+            "upcoming_assessments": ["oop", "sorting"]
+        }
+    }
+
+    vectorized = await prioritization_service.prioritize_by_severity(
+        copy.deepcopy(recommendations), gap_analysis
+    )
+
+    monkeypatch.setattr(recommendation_prioritization_service, "_VECTORIZE_THRESHOLD", len(recommendations))
+    scalar = await prioritization_service.prioritize_by_severity(
+        copy.deepcopy(recommendations), gap_analysis
+    )
+
+    assert [rec.recommendation_id for rec in vectorized] == [rec.recommendation_id for rec in scalar]
+    for vectorized_rec, scalar_rec in zip(vectorized, scalar):
+        assert vectorized_rec.priority_score == pytest.approx(scalar_rec.priority_score)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("candidate_count", [20, 120])
+async def test_prioritize_by_severity_top_k_matches_full_sort_prefix(prioritization_service, candidate_count):
+    """Test top_k returns the same leading recommendations as a full prioritization"""
+    concept_pool = ["loops", "functions", "oop", "recursion", "sorting"]
+    recommendations = [
+        make_recommendation(i, [concept_pool[i % 5]], estimated_impact=(i % 4) / 4)
+        for i in range(candidate_count)
+    ]
+    gap_analysis = {"gap_severities": {"loops": 0.9, "recursion": 0.7}}
+
+    full = await prioritization_service.prioritize_by_severity(
+        copy.deepcopy(recommendations), gap_analysis
+    )
+    top = await prioritization_service.prioritize_by_severity(
+        copy.deepcopy(recommendations), gap_analysis, top_k=5
+    )
+
+    assert [rec.recommendation_id for rec in top] == [rec.recommendation_id for rec in full[:5]]
+
+
+@pytest.mark.asyncio
+async def test_adapt_recommendations_skips_completed_and_adjusts_by_performance(prioritization_service, mock_db):
+    """Test completed recommendations are dropped and related performance adjusts confidence"""
+    now = datetime.utcnow()
+    mock_db.student_performance.find.return_value = mock_cursor([
+        {"score": 2, "max_score": 10, "timestamp": now, "metadata": {"concept_tags": ["loops"]}},
+        {"score": 3, "max_score": 10, "timestamp": now - timedelta(hours=1),
+         "question_responses": [{"concept_tags": ["loops"]}]}
+    ])
+    mock_db.recommendation_feedback.find.return_value = mock_cursor([
+        {"recommendation_id": "rec_1"}
+    ])
+
+    recommendations = [
+        make_recommendation(0, ["loops"]),
+        make_recommendation(1, ["loops"]),
+        make_recommendation(2, ["oop"])
+    ]
+
+    adapted = await prioritization_service.adapt_recommendations_by_progress("student_123", recommendations)
+
+    assert [rec.recommendation_id for rec in adapted] == ["rec_0", "rec_2"]
+
+    # Poor performance on loops boosts confidence, unrelated concepts are unchanged
+    assert adapted[0].confidence_score == pytest.approx(0.6)
+    assert adapted[1].confidence_score == pytest.approx(0.5)
+
+    # Completion lookup is limited to the candidate recommendations
+    feedback_query = mock_db.recommendation_feedback.find.call_args[0][0]
+    assert feedback_query["recommendation_id"] == {"$in": ["rec_0", "rec_1", "rec_2"]}
+
+    # Scores are not written back unless requested
+    mock_db.recommendations.bulk_write.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_adapt_recommendations_persists_scores_in_one_bulk_write(prioritization_service, mock_db):
+    """Test persisted adaptations are written back with a single bulk write"""
+    mock_db.student_performance.find.return_value = mock_cursor([])
+    mock_db.recommendation_feedback.find.return_value = mock_cursor([])
+
+    recommendations = [make_recommendation(i, ["loops"]) for i in range(3)]
+
+    await prioritization_service.adapt_recommendations_by_progress(
+        "student_123", recommendations, persist=True
+    )
+
+    mock_db.recommendations.bulk_write.assert_called_once()
+    operations = mock_db.recommendations.bulk_write.call_args[0][0]
+
+    assert all(isinstance(operation, UpdateOne) for operation in operations)
+    assert [operation._filter for operation in operations] == [
+        {"recommendation_id": f"rec_{i}"} for i in range(3)
+    ]
+    assert set(operations[0]._doc["$set"]) == {"priority_score", "confidence_score", "reasoning"}
+    assert operations[0]._doc["$set"]["reasoning"] == recommendations[0].reasoning
+    assert mock_db.recommendations.bulk_write.call_args[1]["ordered"] is False
+
+
+def test_required_concept_filter_leaves_recommendations_comparable(prioritization_service):
+    """Test concept constraint checks do not add state that breaks model equality or copies"""
+    rec = make_recommendation(0, ["algebra", "fractions"])
+    predicates = prioritization_service._compile_constraint_predicates({"required_concepts": ["fractions"]})
+
+    assert all(predicate(rec) for predicate in predicates)
+    assert rec == rec.model_copy()
+    assert rec == copy.deepcopy(rec)
+    assert not predicates[0](make_recommendation(1, ["geometry"]))
+
+
+@pytest.mark.asyncio
+async def test_recent_performance_bulk_keeps_last_submissions_per_student(prioritization_service, mock_db):
+    """Test one aggregation limits each student while grouping and students without data get an empty list"""
+    groups = [{"_id": "student_1", "docs": [{"score": 8, "max_score": 10}]}]
+
+    async def aggregate_results():
+        for group in groups:
+            yield group
+
+    mock_db.student_performance.aggregate = MagicMock(return_value=aggregate_results())
+
+    recent_performance = await prioritization_service._get_recent_performance_bulk(["student_1", "student_2"])
+
+    assert recent_performance == {"student_1": groups[0]["docs"], "student_2": []}
+
+    pipeline = mock_db.student_performance.aggregate.call_args[0][0]
+    assert pipeline[0]["$match"]["student_id"] == {"$in": ["student_1", "student_2"]}
+    top_n = pipeline[-1]["$group"]["docs"]["$topN"]
+    assert top_n["n"] == 50
+    assert top_n["sortBy"] == {"timestamp": -1}
+    assert not any("$push" in str(stage) for stage in pipeline)
+
+
+@pytest.mark.asyncio
+async def test_recent_performance_bulk_skips_query_without_students(prioritization_service, mock_db):
+    """Test an empty cohort returns an empty mapping without querying"""
+    mock_db.student_performance.aggregate = MagicMock()
+
+    assert await prioritization_service._get_recent_performance_bulk([]) == {}
+    mock_db.student_performance.aggregate.assert_not_called()
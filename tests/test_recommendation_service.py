@@ -0,0 +1,98 @@
+"""
+Tests for the recommendation read service
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.recommendation_service import RecommendationService
+
+
+@pytest.fixture
+def mock_collection():
+    """Create a mock recommendations collection returning one document per query"""
+    collection = MagicMock()
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+
+    async def to_list(length):
+        await asyncio.sleep(0)
+        return [{"_id": "rec_1", "student_id": "student_123", "priority_score": 0.9, "resource": {"title": "Loops"}}]
+
+    cursor.to_list = AsyncMock(side_effect=to_list)
+    collection.find.return_value = cursor
+    return collection
+
+
+@pytest.fixture
+def recommendation_service(mock_collection):
+    """Create a recommendation service instance reading from the mock collection"""
+    service = RecommendationService()
+    service._get_collection = AsyncMock(return_value=mock_collection)
+    return service
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_query_and_release_the_lock(recommendation_service, mock_collection):
+    """Test concurrent reads for a student query once and leave no lock behind"""
+
+    results = await asyncio.gather(*(recommendation_service.get_recommendations("student_123") for _ in range(5)))
+
+    mock_collection.find.assert_called_once()
+    assert all(result == results[0] for result in results)
+    assert recommendation_service._cache_locks == {}
+
+
+@pytest.mark.asyncio
+async def test_failed_query_releases_the_lock(recommendation_service, mock_collection):
+    """Test a failing read does not leave its lock in the lock map"""
+
+    mock_collection.find.side_effect = RuntimeError("connection reset")
+
+    with pytest.raises(RuntimeError):
+        await recommendation_service.get_recommendations("student_123")
+
+    assert recommendation_service._cache_locks == {}
+
+
+@pytest.mark.asyncio
+async def test_returned_recommendations_do_not_alias_the_cache(recommendation_service):
+    """Test mutating returned documents leaves cached documents untouched"""
+
+    first = await recommendation_service.get_recommendations("student_123")
+    first[0]["priority_score"] = 0.0
+    first[0]["resource"]["title"] = "Changed"
+    cached = await recommendation_service.get_recommendations("student_123")
+    cached[0]["completed"] = True
+    cached[0]["resource"]["title"] = "Changed"
+
+    assert await recommendation_service.get_recommendations("student_123") == [
+        {"_id": "rec_1", "student_id": "student_123", "priority_score": 0.9, "resource": {"title": "Loops"}}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_completion_during_a_read_is_not_hidden_by_its_cache_write(recommendation_service, mock_collection):
+    """Test a read in flight when a recommendation completes cannot cache pre-completion documents"""
+
+    release_read = asyncio.Event()
+    read_started = asyncio.Event()
+    original_to_list = mock_collection.find.return_value.to_list.side_effect
+
+    async def slow_to_list(length):
+        read_started.set()
+        await release_read.wait()
+        return await original_to_list(length)
+
+    mock_collection.find.return_value.to_list.side_effect = slow_to_list
+    mock_collection.update_one = AsyncMock(return_value=MagicMock(modified_count=1))
+
+    read = asyncio.create_task(recommendation_service.get_recommendations("student_123"))
+    await read_started.wait()
+    completion = asyncio.create_task(recommendation_service.complete_recommendation("student_123", "rec_1"))
+    await asyncio.sleep(0)
+    release_read.set()
+    await asyncio.gather(read, completion)
+
+    assert recommendation_service._get_cached("student_123", 200) is None
+    assert recommendation_service._cache_locks == {}
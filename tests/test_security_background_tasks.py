@@ -0,0 +1,387 @@
+"""
+Tests for security background tasks
+"""
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+from pymongo.errors import OperationFailure
+
+from app.services import security_background_tasks as security_background_tasks_module
+from app.services.security_background_tasks import SecurityBackgroundTasks
+
+
+def mock_cursor(documents):
+    """Create a mock Motor cursor returning the given documents"""
+    cursor = MagicMock()
+    cursor.limit.return_value = cursor
+    cursor.batch_size.return_value = cursor
+    cursor.__aiter__.return_value = documents
+    cursor.to_list = AsyncMock(return_value=documents)
+    return cursor
+
+
+@pytest.fixture
+def mock_db():
+    """Create a mock database for testing"""
+    db = MagicMock()
+    collections = {}
+
+    def get_collection(name):
+        if name not in collections:
+            collections[name] = MagicMock()
+            collections[name].find.return_value = mock_cursor([{"_id": f"{name}_1"}])
+        return collections[name]
+
+    db.__getitem__.side_effect = get_collection
+    db.security_events.aggregate.return_value = mock_cursor([])
+    db.security_events.update_many = AsyncMock()
+    db.security_alerts.count_documents = AsyncMock(return_value=0)
+    db.compliance_violations.count_documents = AsyncMock(return_value=0)
+
+    return db
+
+
+@pytest.fixture
+def background_tasks(mock_db):
+    """Create a background tasks instance with mocked services"""
+    tasks = SecurityBackgroundTasks()
+    tasks.db = mock_db
+    tasks.monitoring_service = MagicMock()
+    tasks.monitoring_service.monitor_data_corruption = AsyncMock(
+        return_value={"corruption_rate": 0.0, "corrupted_records": 0, "total_records": 1}
+    )
+    tasks.monitoring_service.log_security_event = AsyncMock()
+    tasks.monitoring_service._log_compliance_violations = AsyncMock()
+    tasks.monitoring_service._check_attack_patterns = AsyncMock()
+    tasks.monitoring_service._check_compliance_violations = AsyncMock()
+    tasks.monitoring_service._create_security_alert = AsyncMock()
+    return tasks
+
+
+@pytest.mark.asyncio
+async def test_manual_scan_checks_collections_independently(background_tasks, mock_db):
+    """Test a failing collection check does not prevent the others from completing"""
+    mock_db["learning_gaps"].find.side_effect = RuntimeError("connection reset")
+    mock_db["recommendations"].find.return_value = mock_cursor([])
+
+    scan_results = await background_tasks.run_manual_security_scan()
+    integrity_results = scan_results["results"]["data_integrity"]
+
+    assert integrity_results["users"]["total_records"] == 1
+    assert integrity_results["student_performance"]["total_records"] == 1
+    assert integrity_results["learning_gaps"] == {"error": "connection reset"}
+    assert "recommendations" not in integrity_results
+    assert background_tasks.monitoring_service.monitor_data_corruption.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_unprocessed_events_are_analyzed_per_source_and_marked_in_one_update(background_tasks, mock_db):
+    """Test pattern checks run once per event group and all events are marked processed together"""
+    latest_event = {"event_id": "evt_3", "event_type": "login_failed", "ip_address": "10.0.0.1", "threat_score": 8.0}
+    now = datetime.utcnow()
+    window_events = [{"event_id": f"evt_{n}", "timestamp": now - timedelta(seconds=n)} for n in (3, 2, 1)]
+    mock_db.security_events.aggregate.return_value = mock_cursor([
+        {
+            "_id": {"ip_address": "10.0.0.1", "user_id": None, "event_type": "login_failed"},
+            "document_ids": ["id_1", "id_2", "id_3"],
+            "window_events": window_events,
+            "latest_event": latest_event,
+            "flagged_events": [latest_event, None, None]
+        }
+    ])
+
+    processed_count = await background_tasks._analyze_unprocessed_events(datetime.utcnow())
+
+    assert processed_count == 3
+    monitoring_service = background_tasks.monitoring_service
+    monitoring_service._check_attack_patterns.assert_called_once_with(latest_event, window_events)
+    monitoring_service._check_compliance_violations.assert_called_once_with(latest_event)
+    assert monitoring_service._create_security_alert.call_args[1]["alert_type"] == "high_threat_detected"
+
+    mock_db.security_events.update_many.assert_called_once()
+    query = mock_db.security_events.update_many.call_args[0][0]
+    assert query == {"_id": {"$in": ["id_1", "id_2", "id_3"]}}
+
+
+@pytest.mark.asyncio
+async def test_unprocessed_user_events_are_queued_for_activity_stats(background_tasks, mock_db):
+    """Test background-analyzed events with a user count towards user activity stats"""
+    now = datetime.utcnow()
+    window_events = [{"event_id": f"evt_{n}", "timestamp": now - timedelta(seconds=n)} for n in (2, 1)]
+    mock_db.security_events.aggregate.return_value = mock_cursor([
+        {
+            "_id": {"ip_address": "10.0.0.1", "user_id": "user_1", "event_type": "data_access"},
+            "document_ids": ["id_1", "id_2"],
+            "window_events": window_events,
+            "latest_event": {"event_id": "evt_1", "event_type": "data_access", "user_id": "user_1"},
+            "flagged_events": [None, None]
+        },
+        {
+            "_id": {"ip_address": "10.0.0.2", "user_id": None, "event_type": "login_failed"},
+            "document_ids": ["id_3"],
+            "window_events": [{"event_id": "evt_3", "timestamp": now}],
+            "latest_event": {"event_id": "evt_3", "event_type": "login_failed"},
+            "flagged_events": [None]
+        }
+    ])
+
+    await background_tasks._analyze_unprocessed_events(now)
+
+    background_tasks.monitoring_service._queue_user_activity.assert_called_once_with([
+        {"user_id": "user_1", "timestamp": event["timestamp"]} for event in window_events
+    ])
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_security_events_share_one_write(background_tasks):
+    """Test identical concurrent emissions for the same subject are logged once"""
+    release = asyncio.Event()
+
+    async def slow_log_security_event(**kwargs):
+        await release.wait()
+        return "evt_1"
+
+    background_tasks.monitoring_service.log_security_event = AsyncMock(side_effect=slow_log_security_event)
+
+    emissions = [
+        background_tasks._log_security_event_once(
+            event_type="coordinated_attack_detected", subject="10.0.0.1", ip_address="10.0.0.1"
+        )
+        for _ in range(3)
+    ]
+    other = background_tasks._log_security_event_once(
+        event_type="coordinated_attack_detected", subject="10.0.0.2", ip_address="10.0.0.2"
+    )
+    gathered = asyncio.gather(*emissions, other)
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await gathered == ["evt_1"] * 4
+    assert background_tasks.monitoring_service.log_security_event.call_count == 2
+    assert background_tasks._inflight_events == {}
+
+
+@pytest.mark.asyncio
+async def test_data_access_compliance_streams_student_violations(background_tasks, mock_db):
+    """Test cross-student access events are streamed and only student access is a violation"""
+    mock_db.security_events.find.return_value = mock_cursor([
+        {"event_id": "evt_1", "user_id": "student_1", "event_details": {"user_role": "student"}},
+        {"event_id": "evt_2", "user_id": "teacher_1", "event_details": {"user_role": "teacher"}}
+    ])
+
+    await background_tasks._check_data_access_compliance()
+
+    mock_db.security_events.find.return_value.to_list.assert_not_called()
+    log_violations = background_tasks.monitoring_service._log_compliance_violations
+    log_violations.assert_called_once()
+    violations = log_violations.call_args[0][0]
+    assert [violation["event_id"] for violation in violations] == ["evt_1"]
+    assert violations[0]["violation_type"] == "unauthorized_student_data_access"
+
+
+@pytest.mark.asyncio
+async def test_threat_pattern_alerts_are_logged_per_source(background_tasks, mock_db):
+    """Test every coordinated attack source is logged even if one write fails"""
+    mock_db.security_events.aggregate.return_value = mock_cursor([
+        {"_id": "10.0.0.1", "event_count": 6, "max_threat_score": 8.0, "event_types": ["login_failed"]},
+        {"_id": "10.0.0.2", "event_count": 9, "max_threat_score": 9.5, "event_types": ["unauthorized_access"]}
+    ])
+    background_tasks.monitoring_service.log_security_event = AsyncMock(
+        side_effect=[RuntimeError("write failed"), "evt_2"]
+    )
+
+    await background_tasks._analyze_threat_patterns()
+
+    log_security_event = background_tasks.monitoring_service.log_security_event
+    assert log_security_event.call_count == 2
+    assert {call.kwargs["ip_address"] for call in log_security_event.call_args_list} == {"10.0.0.1", "10.0.0.2"}
+
+
+@pytest.mark.asyncio
+async def test_pattern_analysis_is_skipped_without_new_activity(background_tasks, mock_db):
+    """Test pattern analysis reruns only after new activity or a maximum number of skipped intervals"""
+    now = datetime.utcnow()
+    mock_db.security_events.count_documents = AsyncMock(return_value=3)
+
+    assert await background_tasks._should_run_pattern_analysis(now) is True
+    mock_db.security_events.count_documents.assert_not_called()
+
+    background_tasks._last_pattern_analysis_at = now - timedelta(minutes=5)
+    assert await background_tasks._should_run_pattern_analysis(now) is False
+
+    mock_db.security_events.count_documents.return_value = 11
+    assert await background_tasks._should_run_pattern_analysis(now) is True
+
+    mock_db.security_events.count_documents.reset_mock()
+    background_tasks._last_pattern_analysis_at = now - timedelta(minutes=15)
+    assert await background_tasks._should_run_pattern_analysis(now) is True
+    mock_db.security_events.count_documents.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_user_behavior_anomalies_use_a_single_aggregation(background_tasks, mock_db):
+    """Test recent and historical activity come from one aggregation with no per-user queries"""
+    mock_db.security_events.count_documents = AsyncMock()
+    mock_db.security_events.aggregate.return_value = mock_cursor([
+        {"_id": "user_1", "event_count": 80, "historical_count": 20, "unique_ip_count": 1, "event_types": ["login"]},
+        {"_id": "user_2", "event_count": 60, "historical_count": 5, "unique_ip_count": 0, "event_types": []}
+    ])
+
+    await background_tasks._analyze_user_behavior_anomalies()
+
+    mock_db.security_events.aggregate.assert_called_once()
+    mock_db.security_events.count_documents.assert_not_called()
+
+    log_security_event = background_tasks.monitoring_service.log_security_event
+    assert log_security_event.call_count == 2
+    first_details = log_security_event.call_args_list[0].kwargs["event_details"]
+    assert first_details["recent_event_count"] == 80
+    assert first_details["historical_average"] == 20
+    assert first_details["unique_ips"] == 1
+
+
+@pytest.mark.asyncio
+async def test_security_analysis_falls_back_to_polling_without_change_streams(background_tasks, mock_db):
+    """Test standalone deployments without change streams fall back to polling"""
+    mock_db.security_events.watch.side_effect = OperationFailure(
+        "The $changeStream stage is only supported on replica sets", code=40573
+    )
+    background_tasks.running = True
+
+    assert await background_tasks._stream_security_analysis() is False
+
+
+@pytest.mark.asyncio
+async def test_change_stream_events_are_analyzed_in_batches(background_tasks, mock_db):
+    """Test inserted events are analyzed once per idle batch window rather than per event"""
+    changes = [{"operationType": "insert"}] * 3 + [None, None, {"operationType": "insert"}, None]
+
+    async def try_next():
+        if len(changes) == 1:
+            background_tasks.running = False
+        return changes.pop(0)
+
+    stream = MagicMock()
+    stream.try_next = AsyncMock(side_effect=try_next)
+    mock_db.security_events.watch.return_value.__aenter__.return_value = stream
+    background_tasks._run_security_analysis = AsyncMock()
+    background_tasks.running = True
+
+    assert await background_tasks._stream_security_analysis() is True
+    assert background_tasks._run_security_analysis.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_change_stream_that_never_goes_idle_is_analyzed_by_deadline(background_tasks, mock_db, monkeypatch):
+    """Test a steady trickle of events is analyzed once the batch delay passes instead of waiting for a full batch"""
+    monkeypatch.setattr(security_background_tasks_module, "_CHANGE_STREAM_MAX_BATCH_DELAY_SECONDS", 0.05)
+    remaining_changes = 20
+
+    async def try_next():
+        nonlocal remaining_changes
+        await asyncio.sleep(0.01)
+        remaining_changes -= 1
+        if not remaining_changes:
+            background_tasks.running = False
+        return {"operationType": "insert"}
+
+    stream = MagicMock()
+    stream.try_next = AsyncMock(side_effect=try_next)
+    mock_db.security_events.watch.return_value.__aenter__.return_value = stream
+    background_tasks._run_security_analysis = AsyncMock()
+    background_tasks.running = True
+
+    assert await background_tasks._stream_security_analysis() is True
+    assert background_tasks._run_security_analysis.call_count >= 2
+
+
+@pytest.mark.asyncio
+async def test_initialize_reuses_injected_database(mock_db, monkeypatch):
+    """Test an injected database is used without resolving it again"""
+    get_database = AsyncMock()
+    monkeypatch.setattr(security_background_tasks_module, "get_database", get_database)
+
+    tasks = SecurityBackgroundTasks(mock_db)
+    await tasks.initialize()
+
+    get_database.assert_not_called()
+    assert tasks.db is mock_db
+    assert tasks.monitoring_service.db is mock_db
+    assert tasks.security_service.db is mock_db
+
+
+@pytest.mark.asyncio
+async def test_data_sharing_compliance_filters_consent_in_query(background_tasks, mock_db):
+    """Test only exports without consent are fetched and each is logged as a violation"""
+    mock_db.security_events.find.return_value = mock_cursor([
+        {"event_id": "evt_1", "user_id": "user_1", "event_details": {"external_sharing": True}}
+    ])
+
+    await background_tasks._check_data_sharing_compliance()
+
+    query = mock_db.security_events.find.call_args[0][0]
+    assert query["event_details.consent_obtained"] == {"$in": [None, False, 0, ""]}
+
+    violations = background_tasks.monitoring_service._log_compliance_violations.call_args[0][0]
+    assert len(violations) == 1
+    assert violations[0]["violation_type"] == "unauthorized_data_sharing"
+
+
+@pytest.mark.asyncio
+async def test_security_analysis_run_is_cancelled_after_its_time_budget(background_tasks):
+    """Test a stuck analysis run is cancelled instead of blocking later runs"""
+    background_tasks.security_analysis_interval = 0.05
+
+    async def stuck_analysis(cutoff_time):
+        await asyncio.sleep(10)
+
+    background_tasks._analyze_unprocessed_events = AsyncMock(side_effect=stuck_analysis)
+    background_tasks._analyze_threat_patterns = AsyncMock()
+
+    await asyncio.wait_for(background_tasks._run_security_analysis(), timeout=1)
+
+    background_tasks._analyze_threat_patterns.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_scheduler_runs_tasks_at_their_own_intervals(background_tasks):
+    """Test one scheduler runs each task on its interval without overlapping itself"""
+    fast_runs = []
+    slow_started = asyncio.Event()
+
+    async def fast_task():
+        fast_runs.append(asyncio.get_running_loop().time())
+
+    async def slow_task():
+        slow_started.set()
+        await asyncio.sleep(0.2)
+
+    slow_task_mock = AsyncMock(side_effect=slow_task)
+    background_tasks.running = True
+    scheduler = asyncio.create_task(
+        background_tasks._run_scheduler([(fast_task, 0.02), (slow_task_mock, 0.05)])
+    )
+
+    await asyncio.sleep(0.15)
+    background_tasks.running = False
+    await asyncio.wait_for(scheduler, timeout=1)
+
+    assert len(fast_runs) >= 4
+    assert slow_started.is_set()
+    # The slow task is still running at each later deadline, so it is never started twice
+    assert slow_task_mock.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_scheduled_security_analysis_is_skipped_while_streaming(background_tasks):
+    """Test scheduled security analysis defers to an active change stream"""
+    background_tasks._run_security_analysis = AsyncMock()
+
+    background_tasks._streaming_security_events = True
+    await background_tasks._run_scheduled_security_analysis()
+    background_tasks._run_security_analysis.assert_not_called()
+
+    background_tasks._streaming_security_events = False
+    await background_tasks._run_scheduled_security_analysis()
+    background_tasks._run_security_analysis.assert_called_once()
@@ -7,6 +7,7 @@ from datetime import datetime, timedelta
 from unittest.mock import AsyncMock, MagicMock
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+from app.services import security_monitoring_service as security_monitoring_service_module
 from app.services.security_monitoring_service import SecurityMonitoringService
 
 
@@ -172,6 +173,497 @@ async def test_monitor_data_corruption(security_monitoring_service, mock_db):
     mock_db.data_integrity_checks.insert_one.assert_called_once()
 
 
+@pytest.mark.asyncio
+async def test_monitor_data_corruption_vectorized_matches_scalar(security_monitoring_service, monkeypatch):
+    """Test large samples are validated column-wise with the same results as per-record checks"""
+    
+    sample_data = []
+    for i in range(120):
+        record = {"user_id": f"user_{i}", "email": f"user{i}@example.com", "created_at": datetime.utcnow()}
+        if i % 7 == 0:
+            record["email"] = "invalid_email"
+        if i % 11 == 0:
+            record["user_id"] = ""
+        if i % 13 == 0:
+            del record["created_at"]
+        if i % 17 == 0:
+            record["email"] = 42
+        if i % 19 == 0:
+            record["user_id"] = "' OR '1'='1"
+        sample_data.append(record)
+    
+    expected_schema = {
+        "user_id": {"type": "string", "required": True, "validation": {"min_length": 1}},
+        "email": {"type": "string", "required": True, "validation": {"pattern": r"^[^@]+@[^@]+\.[^@]+$"}},
+        "created_at": {"type": "datetime", "required": True}
+    }
+    
+    vectorized = await security_monitoring_service.monitor_data_corruption(
+        collection_name="test_collection",
+        data_sample=sample_data,
+        expected_schema=expected_schema
+    )
+    
+    monkeypatch.setattr(security_monitoring_service_module, "_VECTORIZE_THRESHOLD", len(sample_data))
+    scalar = await security_monitoring_service.monitor_data_corruption(
+        collection_name="test_collection",
+        data_sample=sample_data,
+        expected_schema=expected_schema
+    )
+    
+    assert vectorized["corrupted_records"] == scalar["corrupted_records"]
+    assert vectorized["corruption_rate"] == scalar["corruption_rate"]
+    assert dict(vectorized["corruption_types"]) == dict(scalar["corruption_types"])
+
+
+def test_compiled_schema_validator_reports_field_issues():
+    """Test a compiled schema validator reports missing, type, length and pattern issues per field"""
+
+    validator = security_monitoring_service_module._compile_schema_validator({
+        "user_id": {"type": "string", "required": True, "validation": {"min_length": 3}},
+        "email": {"type": "string", "required": True, "validation": {"pattern": r"^[^@]+@[^@]+$"}},
+        "age": {"type": "integer"},
+        "nickname": {"type": "unknown", "required": False}
+    })
+
+    assert validator({"user_id": "user_1", "email": "a@b", "age": 30, "nickname": 7}) == []
+    assert validator({"user_id": "u", "email": "invalid"}) == ["invalid_length_user_id", "invalid_pattern_email"]
+    assert validator({"email": 42, "age": "thirty"}) == [
+        "missing_required_field_user_id", "invalid_type_email", "invalid_type_age"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_log_compliance_violations_uses_single_insert(security_monitoring_service):
+    """Test several compliance violations are stored with one insert and alerted individually"""
+    
+    security_monitoring_service._create_security_alert = AsyncMock()
+    violations = [
+        {
+            "event_id": f"evt_{i}",
+            "user_id": f"student_{i}",
+            "violation_type": "unauthorized_student_data_access",
+            "regulation": "FERPA",
+            "description": "Student attempted to access another student's educational records",
+            "event_details": {}
+        }
+        for i in range(3)
+    ]
+    
+    await security_monitoring_service._log_compliance_violations(violations)
+    
+    insert_many = security_monitoring_service.compliance_violations_collection.insert_many
+    insert_many.assert_called_once()
+    records = insert_many.call_args[0][0]
+    assert [record["event_id"] for record in records] == ["evt_0", "evt_1", "evt_2"]
+    assert all(record["resolved"] is False for record in records)
+    assert insert_many.call_args[1]["ordered"] is False
+    assert security_monitoring_service._create_security_alert.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_buffered_security_events_are_written_in_one_batch(security_monitoring_service):
+    """Test buffered events share one insert_many and one processed update"""
+
+    security_monitoring_service._get_geolocation = AsyncMock(return_value=None)
+    security_monitoring_service._calculate_threat_score = AsyncMock(return_value=1.0)
+    security_monitoring_service._check_attack_patterns = AsyncMock()
+    security_monitoring_service._check_compliance_violations = AsyncMock()
+
+    event_ids = [
+        await security_monitoring_service.log_security_event(
+            event_type="rate_limit_exceeded",
+            ip_address="10.0.0.1",
+            buffered=True
+        )
+        for _ in range(3)
+    ]
+    await SecurityMonitoringService.flush_buffered_events()
+    await asyncio.sleep(0)
+
+    events_collection = security_monitoring_service.security_events_collection
+    events_collection.insert_one.assert_not_called()
+    events_collection.insert_many.assert_called_once()
+    assert [event["event_id"] for event in events_collection.insert_many.call_args[0][0]] == event_ids
+    assert events_collection.insert_many.call_args[1]["ordered"] is False
+
+    events_collection.update_many.assert_called_once()
+    assert events_collection.update_many.call_args[0][0] == {"event_id": {"$in": event_ids}}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("resource_type, user_role, access_type, resource_id, expected", [
+    ("student_data", "student", "read_own", "student_123", False),
+    ("student_data", "student", "read_own", "student_456", True),
+    ("student_data", "student", "read_class", "class_1", True),
+    ("student_data", "instructor", "read_class", "class_1", False),
+    ("analytics_data", "admin", "write_all", "report_1", False),
+    ("system_config", "instructor", "read_all", "config", True),
+    ("unknown_resource", "admin", "read_all", "anything", True)
+])
+async def test_detect_unauthorized_access_rules(
+    security_monitoring_service, resource_type, user_role, access_type, resource_id, expected
+):
+    """Test access decisions from the flattened rule table and logging of denials"""
+
+    security_monitoring_service.log_security_event = AsyncMock()
+
+    is_unauthorized = await security_monitoring_service.detect_unauthorized_access(
+        user_id="student_123",
+        resource_id=resource_id,
+        resource_type=resource_type,
+        access_type=access_type,
+        user_role=user_role
+    )
+
+    assert is_unauthorized is expected
+    assert security_monitoring_service.log_security_event.called is expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("event_type, severity, threat_score, checks_patterns", [
+    ("page_view", "info", 1.0, False),
+    ("page_view", "warning", 1.0, True),
+    ("page_view", "info", 5.0, True),
+    ("login_failed", "info", 2.0, True)
+])
+async def test_routine_events_skip_attack_pattern_checks(
+    security_monitoring_service, event_type, severity, threat_score, checks_patterns
+):
+    """Test low-threat informational events skip pattern checks but still get compliance checks"""
+
+    security_monitoring_service._check_attack_patterns = AsyncMock()
+    security_monitoring_service._check_compliance_violations = AsyncMock()
+
+    await security_monitoring_service._evaluate_security_event({
+        "event_id": "evt_1",
+        "event_type": event_type,
+        "severity": severity,
+        "threat_score": threat_score,
+        "user_id": "test_user_123"
+    })
+
+    assert security_monitoring_service._check_attack_patterns.called is checks_patterns
+    security_monitoring_service._check_compliance_violations.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_processed_updates_are_coalesced(security_monitoring_service, monkeypatch):
+    """Test events analyzed one by one are marked processed with a single update_many"""
+
+    monkeypatch.setattr(SecurityMonitoringService, "_processed_event_ids", [])
+    security_monitoring_service._evaluate_security_event = AsyncMock()
+
+    for i in range(3):
+        await security_monitoring_service._analyze_security_event({"event_id": f"evt_{i}"})
+    await SecurityMonitoringService.flush_buffered_events()
+
+    events_collection = security_monitoring_service.security_events_collection
+    events_collection.update_one.assert_not_called()
+    events_collection.update_many.assert_called_once()
+    assert events_collection.update_many.call_args[0][0] == {"event_id": {"$in": ["evt_0", "evt_1", "evt_2"]}}
+
+
+@pytest.mark.asyncio
+async def test_analysis_jobs_are_bounded_by_worker_queue(security_monitoring_service, monkeypatch):
+    """Test analysis runs on the shared worker pool and overflow is dropped instead of spawning tasks"""
+
+    monkeypatch.setattr(security_monitoring_service_module, "_ANALYSIS_QUEUE_SIZE", 1)
+    monkeypatch.setattr(security_monitoring_service_module, "_ANALYSIS_WORKERS", 1)
+    monkeypatch.setattr(SecurityMonitoringService, "dropped_analysis_jobs", 0)
+    job = AsyncMock()
+
+    for _ in range(3):
+        security_monitoring_service._schedule_analysis(job)
+    await SecurityMonitoringService.flush_buffered_events()
+
+    job.assert_awaited_once()
+    assert SecurityMonitoringService.dropped_analysis_jobs == 2
+
+
+@pytest.mark.asyncio
+async def test_geographic_anomaly_uses_redis_recent_countries(security_monitoring_service, monkeypatch):
+    """Test usual countries come from the Redis recent-country set, with MongoDB as the fallback"""
+
+    cache = MagicMock()
+    cache.record_recent_member = AsyncMock(return_value=["US", "CA"])
+    monkeypatch.setattr(security_monitoring_service_module, "cache_manager", cache)
+    events_collection = security_monitoring_service.security_events_collection
+    events_collection.find = MagicMock()
+
+    assert await security_monitoring_service._check_geographic_anomaly("user_1", {"country": "US"}) == 0.0
+    assert await security_monitoring_service._check_geographic_anomaly("user_1", {"country": "FR"}) == 2.0
+    assert cache.record_recent_member.call_args[0][:2] == ("user_countries:user_1", "FR")
+    events_collection.find.assert_not_called()
+
+    # Redis unavailable: usual countries are read from recent events
+    cache.record_recent_member.return_value = None
+    cursor = MagicMock()
+    cursor.to_list = AsyncMock(return_value=[{"geolocation": {"country": "FR"}}])
+    events_collection.find.return_value = cursor
+
+    assert await security_monitoring_service._check_geographic_anomaly("user_1", {"country": "FR"}) == 0.0
+    events_collection.find.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_attack_patterns_use_single_facet_aggregation(security_monitoring_service, monkeypatch):
+    """Test pattern checks share one aggregation round-trip and alert from its counts"""
+
+    # Redis unavailable: failed logins are counted by the aggregation as well
+    cache = MagicMock()
+    cache.add_to_sliding_window = AsyncMock(return_value=None)
+    monkeypatch.setattr(security_monitoring_service_module, "cache_manager", cache)
+    security_monitoring_service._create_security_alert = AsyncMock()
+    cursor = MagicMock()
+    cursor.to_list = AsyncMock(return_value=[{
+        "ip_failed": [{"n": 6}],
+        "user_failed": [],
+        "recent_5m": [{"n": 2}],
+        "exports_1h": [{"_id": None, "n": 8, "records": 5000}]
+    }])
+    events_collection = security_monitoring_service.security_events_collection
+    events_collection.aggregate = MagicMock(return_value=cursor)
+
+    await security_monitoring_service._check_attack_patterns({
+        "event_id": "evt_1",
+        "event_type": "login_failed",
+        "user_id": "test_user_123",
+        "ip_address": "192.168.1.100",
+        "timestamp": datetime.utcnow().replace(hour=12)
+    })
+
+    events_collection.aggregate.assert_called_once()
+    events_collection.count_documents.assert_not_called()
+    pipeline = events_collection.aggregate.call_args[0][0]
+    assert set(pipeline[1]["$facet"]) == {"ip_failed", "user_failed", "recent_5m"}
+
+    alert_types = [call.kwargs["alert_type"] for call in security_monitoring_service._create_security_alert.call_args_list]
+    assert alert_types == ["brute_force_attack"]
+
+
+@pytest.mark.asyncio
+async def test_data_exfiltration_totals_are_grouped_in_the_aggregation(security_monitoring_service):
+    """Test export totals come from the aggregation's $group rather than fetched events"""
+
+    security_monitoring_service._create_security_alert = AsyncMock()
+    cursor = MagicMock()
+    cursor.to_list = AsyncMock(return_value=[{
+        "recent_5m": [{"n": 1}],
+        "exports_1h": [{"_id": None, "n": 8, "records": 5000}]
+    }])
+    events_collection = security_monitoring_service.security_events_collection
+    events_collection.aggregate = MagicMock(return_value=cursor)
+    events_collection.find = MagicMock()
+
+    await security_monitoring_service._check_attack_patterns({
+        "event_id": "evt_1",
+        "event_type": "data_export",
+        "user_id": "test_user_123",
+        "timestamp": datetime.utcnow().replace(hour=12)
+    })
+
+    events_collection.find.assert_not_called()
+    pipeline = events_collection.aggregate.call_args[0][0]
+    assert set(pipeline[1]["$facet"]) == {"recent_5m", "exports_1h"}
+    assert "$group" in pipeline[1]["$facet"]["exports_1h"][1]
+
+    alert = security_monitoring_service._create_security_alert.call_args.kwargs
+    assert alert["alert_type"] == "potential_data_exfiltration"
+    assert alert["details"]["total_records"] == 5000
+
+
+@pytest.mark.asyncio
+async def test_brute_force_counts_come_from_redis_sliding_window(security_monitoring_service, monkeypatch):
+    """Test failed logins are counted in Redis without querying MongoDB"""
+
+    cache = MagicMock()
+    cache.add_to_sliding_window = AsyncMock(return_value=5)
+    monkeypatch.setattr(security_monitoring_service_module, "cache_manager", cache)
+    security_monitoring_service._create_security_alert = AsyncMock()
+    events_collection = security_monitoring_service.security_events_collection
+    events_collection.aggregate = MagicMock()
+
+    await security_monitoring_service._check_attack_patterns({
+        "event_id": "evt_1",
+        "event_type": "login_failed",
+        "ip_address": "192.168.1.100",
+        "timestamp": datetime.utcnow()
+    })
+
+    cache.add_to_sliding_window.assert_called_once_with("bf:ip:192.168.1.100", "evt_1", 900)
+    events_collection.aggregate.assert_not_called()
+    assert security_monitoring_service._create_security_alert.call_args.kwargs["alert_type"] == "brute_force_attack"
+
+
+@pytest.mark.asyncio
+async def test_grouped_failed_logins_are_all_recorded_in_the_window(security_monitoring_service, monkeypatch):
+    """Test every event a grouped check stands for is added to the window at its own timestamp"""
+    
+    cache = MagicMock()
+    cache.add_to_sliding_window = AsyncMock(return_value=3)
+    monkeypatch.setattr(security_monitoring_service_module, "cache_manager", cache)
+    security_monitoring_service._create_security_alert = AsyncMock()
+    timestamp = datetime(2024, 1, 1, 12, 0, 0)
+    window_events = [
+        {"event_id": "evt_1", "timestamp": timestamp},
+        {"event_id": "evt_2", "timestamp": timestamp + timedelta(seconds=1)}
+    ]
+    
+    await security_monitoring_service._check_attack_patterns({
+        "event_id": "evt_2",
+        "event_type": "login_failed",
+        "ip_address": "192.168.1.100",
+        "timestamp": timestamp + timedelta(seconds=1)
+    }, window_events)
+    
+    key, members, window_seconds = cache.add_to_sliding_window.call_args[0]
+    assert key == "bf:ip:192.168.1.100"
+    assert members == {"evt_1": 1704110400000, "evt_2": 1704110401000}
+    assert window_seconds == 900
+
+
+@pytest.mark.asyncio
+async def test_unusual_access_time_reads_user_activity_stats(security_monitoring_service):
+    """Test the unusual-hours ratio sums the user's daily stats instead of counting events"""
+
+    security_monitoring_service._create_security_alert = AsyncMock()
+    cursor = MagicMock()
+    cursor.to_list = AsyncMock(return_value=[{"_id": None, "total_events": 20, "unusual_hour_events": 18}])
+    security_monitoring_service.user_activity_stats_collection = MagicMock()
+    security_monitoring_service.user_activity_stats_collection.aggregate.return_value = cursor
+    events_collection = security_monitoring_service.security_events_collection
+
+    await security_monitoring_service._check_suspicious_access_patterns(
+        {"event_id": "evt_1", "user_id": "test_user_123", "timestamp": datetime.utcnow().replace(hour=3)},
+        {"recent_events": 0}
+    )
+
+    events_collection.count_documents.assert_not_called()
+    pipeline = security_monitoring_service.user_activity_stats_collection.aggregate.call_args[0][0]
+    assert pipeline[0]["$match"]["user_id"] == "test_user_123"
+    alert = security_monitoring_service._create_security_alert.call_args.kwargs
+    assert alert["alert_type"] == "unusual_access_time"
+    assert alert["details"]["unusual_ratio"] == pytest.approx(0.9)
+
+
+@pytest.mark.asyncio
+async def test_user_activity_stats_are_backfilled_until_they_cover_the_window(security_monitoring_service):
+    """Test past days are rebuilt from processed events once, and skipped when the stats cover the window"""
+
+    stats_collection = MagicMock()
+    stats_collection.find_one = AsyncMock(return_value=None)
+    security_monitoring_service.user_activity_stats_collection = stats_collection
+    cursor = MagicMock()
+    cursor.to_list = AsyncMock(return_value=[])
+    events_collection = security_monitoring_service.security_events_collection
+    events_collection.aggregate = MagicMock(return_value=cursor)
+    now = datetime(2024, 5, 31, 15, 30)
+
+    assert await security_monitoring_service.backfill_user_activity_stats(now) is True
+
+    pipeline = events_collection.aggregate.call_args[0][0]
+    assert pipeline[0]["$match"]["processed"] is True
+    assert pipeline[0]["$match"]["timestamp"] == {"$gte": datetime(2024, 5, 1), "$lt": datetime(2024, 5, 31)}
+    assert pipeline[-1]["$merge"]["into"] == "user_activity_stats"
+    assert pipeline[-1]["$merge"]["on"] == ["user_id", "day"]
+
+    stats_collection.find_one.return_value = {"_id": "stats_1"}
+    events_collection.aggregate.reset_mock()
+
+    assert await security_monitoring_service.backfill_user_activity_stats(now) is False
+    events_collection.aggregate.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_processed_events_update_daily_user_activity(security_monitoring_service, monkeypatch):
+    """Test processed events are folded into per-user daily counts with one bulk write"""
+
+    monkeypatch.setattr(SecurityMonitoringService, "_processed_event_ids", [])
+    monkeypatch.setattr(SecurityMonitoringService, "_pending_user_activity", {})
+    security_monitoring_service.user_activity_stats_collection = AsyncMock()
+    day = datetime(2024, 5, 1)
+
+    security_monitoring_service._mark_events_processed([
+        {"event_id": "evt_1", "user_id": "user_1", "timestamp": day.replace(hour=3)},
+        {"event_id": "evt_2", "user_id": "user_1", "timestamp": day.replace(hour=14)},
+        {"event_id": "evt_3", "user_id": "user_2", "timestamp": day.replace(hour=23)},
+        {"event_id": "evt_4", "user_id": None, "timestamp": day}
+    ])
+    await SecurityMonitoringService.flush_buffered_events()
+
+    bulk_write = security_monitoring_service.user_activity_stats_collection.bulk_write
+    bulk_write.assert_called_once()
+    operations = {
+        operation._filter["user_id"]: operation._doc["$inc"]
+        for operation in bulk_write.call_args[0][0]
+    }
+    assert operations == {
+        "user_1": {"total_events": 2, "unusual_hour_events": 1},
+        "user_2": {"total_events": 1, "unusual_hour_events": 1}
+    }
+    assert bulk_write.call_args[1]["ordered"] is False
+
+
+@pytest.mark.asyncio
+async def test_geolocation_is_cached_per_ip(security_monitoring_service, monkeypatch):
+    """Test repeat IPs skip the lookup and private ranges are never looked up"""
+
+    cache = MagicMock()
+    cache.get_cache = AsyncMock(return_value=None)
+    cache.set_cache = AsyncMock(return_value=True)
+    monkeypatch.setattr(security_monitoring_service_module, "cache_manager", cache)
+    monkeypatch.setattr(SecurityMonitoringService, "_geolocation_cache", {})
+    lookup = AsyncMock(return_value={"country": "Unknown"})
+    security_monitoring_service._lookup_geolocation = lookup
+
+    first = await security_monitoring_service._get_geolocation("8.8.8.8")
+    second = await security_monitoring_service._get_geolocation("8.8.8.8")
+
+    assert first == second == {"country": "Unknown"}
+    lookup.assert_called_once_with("8.8.8.8")
+    cache.get_cache.assert_called_once_with("geo:8.8.8.8")
+
+    assert await security_monitoring_service._get_geolocation("172.20.1.1") is None
+    assert await security_monitoring_service._get_geolocation("172.32.1.1") == {"country": "Unknown"}
+    assert lookup.call_count == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("claimed, expect_alert", [(True, True), (False, False), (None, True)])
+async def test_alert_cooldown_is_claimed_atomically(security_monitoring_service, monkeypatch, claimed, expect_alert):
+    """Test alerts are stored only when the cooldown key is newly set or Redis is unavailable"""
+
+    cache = MagicMock()
+    cache.set_if_not_exists = AsyncMock(return_value=claimed)
+    monkeypatch.setattr(security_monitoring_service_module, "cache_manager", cache)
+
+    await security_monitoring_service._create_security_alert(
+        alert_type="brute_force_attack",
+        event_id="evt_1",
+        severity="critical",
+        details={"ip_address": "192.168.1.100"}
+    )
+
+    cache.set_if_not_exists.assert_called_once()
+    assert cache.set_if_not_exists.call_args[0][0] == "alert_cooldown:brute_force_attack:system"
+    assert security_monitoring_service.security_alerts_collection.insert_one.called is expect_alert
+
+
+@pytest.mark.parametrize("record, expected", [
+    ({"name": "Alice", "bio": "x' or '1'='1"}, True),
+    ({"name": "<SCRIPT>alert(1)</SCRIPT>"}, True),
+    ({"note": "fine", "other": "Union Select password"}, True),
+    ({"email": "jose.nunez@example.com", "name": "José Núñez"}, False),
+    ({"name": "!!@@##$$", "age": 20}, True),
+    ({"name": "union", "other": "select"}, False)
+])
+def test_detect_suspicious_data_patterns(security_monitoring_service, record, expected):
+    """Test injection markers are matched case-insensitively and special-character noise is flagged"""
+
+    assert security_monitoring_service._detect_suspicious_data_patterns(record) is expected
+
+
 @pytest.mark.asyncio
 async def test_threat_score_calculation(security_monitoring_service, mock_db):
     """Test threat score calculation"""
@@ -239,6 +731,56 @@ async def test_compliance_violation_detection(security_monitoring_service, mock_
     assert call_args["regulation"] == "FERPA"
 
 
+def mock_aggregation_cursor(documents):
+    """Create a mock aggregation cursor returning the given documents"""
+    cursor = MagicMock()
+    cursor.to_list = AsyncMock(return_value=documents)
+    return cursor
+
+
+@pytest.mark.asyncio
+async def test_security_dashboard_data_gathers_queries(security_monitoring_service):
+    """Test dashboard queries are combined correctly and top threats are pruned to grouped fields"""
+    
+    event_stats = [{"_id": "login_failed", "count": 5, "avg_threat_score": 2.5}]
+    alert_stats = [{"_id": "high", "count": 3}]
+    top_threats = [{"_id": "203.0.113.5", "threat_count": 4, "max_threat_score": 8.0}]
+    events_collection = security_monitoring_service.security_events_collection
+    events_collection.aggregate = MagicMock(side_effect=[
+        mock_aggregation_cursor(event_stats), mock_aggregation_cursor(top_threats)
+    ])
+    security_monitoring_service.security_alerts_collection.aggregate = MagicMock(
+        return_value=mock_aggregation_cursor(alert_stats)
+    )
+    security_monitoring_service.compliance_violations_collection.count_documents = AsyncMock(return_value=2)
+    
+    dashboard_data = await security_monitoring_service.get_security_dashboard_data()
+    
+    assert dashboard_data["event_statistics"] == event_stats
+    assert dashboard_data["alert_statistics"] == alert_stats
+    assert dashboard_data["compliance_violations"] == 2
+    assert dashboard_data["top_threat_sources"] == top_threats
+    
+    pipeline = events_collection.aggregate.call_args_list[1][0][0]
+    assert list(pipeline[0]) == ["$match"]
+    assert pipeline[1] == {"$project": {"_id": 0, "ip_address": 1, "threat_score": 1}}
+    assert list(pipeline[2]) == ["$group"]
+
+
+@pytest.mark.asyncio
+async def test_cleanup_old_events_defers_to_ttl_index(security_monitoring_service):
+    """Test only retention periods shorter than the TTL window issue a bulk delete"""
+    
+    events_collection = security_monitoring_service.security_events_collection
+    events_collection.delete_many = AsyncMock(return_value=MagicMock(deleted_count=7))
+    
+    assert await security_monitoring_service.cleanup_old_events(retention_days=90) == 0
+    events_collection.delete_many.assert_not_called()
+    
+    assert await security_monitoring_service.cleanup_old_events(retention_days=30) == 7
+    events_collection.delete_many.assert_called_once()
+
+
 @pytest.mark.asyncio
 async def test_security_dashboard_data(security_monitoring_service, mock_db):
     """Test security dashboard data generation"""
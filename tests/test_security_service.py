@@ -0,0 +1,234 @@
+"""
+Tests for the security management service
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.models.user import UserRole
+from app.services import security_service as security_service_module
+from app.services.security_service import SecurityService, SecurityEventType, FeaturePermission
+
+
+@pytest.fixture
+def mock_db():
+    """Create a mock database for testing"""
+    db = MagicMock()
+
+    db.security_events = AsyncMock()
+    db.security_events.insert_one = AsyncMock()
+    db.security_events.count_documents = AsyncMock(return_value=0)
+
+    db.user_sessions = AsyncMock()
+
+    return db
+
+
+@pytest.fixture
+def mock_cache(monkeypatch):
+    """Replace the Redis cache manager used by the security service"""
+    cache = MagicMock()
+    cache.add_to_sliding_window = AsyncMock(return_value=1)
+    cache.get_cache = AsyncMock(return_value=None)
+    cache.set_cache = AsyncMock(return_value=True)
+    cache.set_if_not_exists = AsyncMock(return_value=True)
+    cache.delete_cache = AsyncMock(return_value=True)
+    cache.cache_exists = AsyncMock(return_value=False)
+    monkeypatch.setattr(security_service_module, "cache_manager", cache)
+    return cache
+
+
+@pytest.fixture
+def security_service(mock_db):
+    """Create a security service instance for testing"""
+    return SecurityService(mock_db)
+
+
+@pytest.mark.asyncio
+async def test_failed_login_pattern_counts_redis_sliding_window(security_service, mock_db, mock_cache):
+    """Test repeated failed logins are counted in Redis and flagged without querying MongoDB"""
+
+    mock_cache.add_to_sliding_window.return_value = 5
+
+    await security_service.log_security_event(
+        event_type=SecurityEventType.FAILED_LOGIN,
+        user_id="user_123",
+        ip_address="203.0.113.5"
+    )
+
+    key, _, window_seconds = mock_cache.add_to_sliding_window.call_args_list[0][0]
+    assert key == "failed_login:user:user_123"
+    assert window_seconds == 900
+
+    mock_db.security_events.count_documents.assert_not_called()
+
+    stored_event_types = [call[0][0]["event_type"] for call in mock_db.security_events.insert_one.call_args_list]
+    assert stored_event_types == ["failed_login", "suspicious_activity"]
+    mock_cache.set_cache.assert_called_once()
+    assert mock_cache.set_cache.call_args[0] == ("suspicious_ip:203.0.113.5", "1")
+    assert mock_cache.set_cache.call_args[1]["expire"] == 3600
+
+
+@pytest.mark.asyncio
+async def test_unauthorized_access_pattern_falls_back_to_mongo(security_service, mock_db, mock_cache):
+    """Test unauthorized access attempts are counted in MongoDB when Redis is unavailable"""
+
+    mock_cache.add_to_sliding_window.return_value = None
+    mock_db.security_events.count_documents.return_value = 1
+
+    await security_service.log_security_event(
+        event_type=SecurityEventType.UNAUTHORIZED_ACCESS,
+        ip_address="203.0.113.5"
+    )
+
+    assert mock_cache.add_to_sliding_window.call_args[0][0] == "unauthorized_access:ip:203.0.113.5"
+
+    query = mock_db.security_events.count_documents.call_args[0][0]
+    assert query["event_type"] == "unauthorized_access"
+    assert query["ip_address"] == "203.0.113.5"
+    assert "user_id" not in query
+
+    # Below the threshold no suspicious activity event is logged
+    mock_db.security_events.insert_one.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_check_feature_access_enforces_role_and_ownership(security_service, mock_db, mock_cache):
+    """Test role permissions gate features and own-data permissions require elevated roles for others' data"""
+
+    assert await security_service.check_feature_access(
+        "student_1", UserRole.STUDENT, FeaturePermission.VIEW_OWN_DASHBOARD, "student_1"
+    )
+    assert not await security_service.check_feature_access(
+        "student_1", UserRole.STUDENT, FeaturePermission.VIEW_OWN_DASHBOARD, "student_2"
+    )
+    assert await security_service.check_feature_access(
+        "instructor_1", UserRole.INSTRUCTOR, FeaturePermission.VIEW_OWN_PERFORMANCE, "student_2"
+    )
+    assert not await security_service.check_feature_access(
+        "instructor_1", UserRole.INSTRUCTOR, FeaturePermission.MANAGE_USERS
+    )
+    assert await security_service.check_feature_access(
+        "admin_1", UserRole.ADMIN, FeaturePermission.SYSTEM_CONFIGURATION
+    )
+
+    stored_event_types = [call[0][0]["event_type"] for call in mock_db.security_events.insert_one.call_args_list]
+    assert stored_event_types == ["data_access_violation", "unauthorized_access"]
+
+
+@pytest.mark.parametrize("event_type, severity", [
+    (SecurityEventType.ROLE_ESCALATION_ATTEMPT, "HIGH"),
+    (SecurityEventType.INVALID_TOKEN, "MEDIUM"),
+    (SecurityEventType.DATA_EXPORT_REQUEST, "LOW")
+])
+def test_get_event_severity(security_service, event_type, severity):
+    """Test event types map to their severity with LOW as the default"""
+
+    assert security_service._get_event_severity(event_type) == severity
+
+
+@pytest.mark.asyncio
+async def test_buffered_events_are_batch_inserted(security_service, mock_db, mock_cache):
+    """Test buffered events are written with one unordered insert_many and still pattern checked"""
+
+    mock_db.security_events.insert_many = AsyncMock()
+
+    for attempt in range(3):
+        await security_service.log_security_event(
+            event_type=SecurityEventType.FAILED_LOGIN,
+            ip_address="203.0.113.5",
+            details={"attempt": attempt},
+            buffered=True
+        )
+
+    await SecurityService.flush_buffered_events()
+
+    assert mock_cache.add_to_sliding_window.call_count == 3
+
+    mock_db.security_events.insert_one.assert_not_called()
+    mock_db.security_events.insert_many.assert_called_once()
+    batch = mock_db.security_events.insert_many.call_args[0][0]
+    assert [event["details"]["attempt"] for event in batch] == [0, 1, 2]
+    assert mock_db.security_events.insert_many.call_args[1]["ordered"] is False
+
+
+@pytest.mark.asyncio
+async def test_create_user_session_stores_and_caches_session(security_service, mock_db, mock_cache):
+    """Test a new session is written to MongoDB and cached under its token"""
+
+    mock_db.user_sessions.insert_one = AsyncMock()
+
+    await security_service.create_user_session("user_123", "token_abc", ip_address="203.0.113.5")
+
+    stored_session = mock_db.user_sessions.insert_one.call_args[0][0]
+    cache_key, cached_session = mock_cache.set_cache.call_args[0]
+
+    assert cache_key == "session:token_abc"
+    assert stored_session == cached_session
+    assert stored_session is not cached_session
+    assert cached_session["active"] is True
+    assert 0 < mock_cache.set_cache.call_args[1]["expire"] <= 24 * 3600
+
+
+@pytest.mark.asyncio
+async def test_validate_user_session_writes_last_activity_once_per_interval(security_service, mock_db, mock_cache):
+    """Test repeated validations only update last_activity when the Redis write guard is claimed"""
+
+    mock_db.user_sessions.update_one = AsyncMock()
+    mock_cache.get_cache.return_value = {"user_id": "user_123", "session_token": "token_abc"}
+    mock_cache.set_if_not_exists.side_effect = [True, False, False]
+
+    for _ in range(3):
+        session = await security_service.validate_user_session("token_abc")
+        assert session["user_id"] == "user_123"
+
+    mock_db.user_sessions.update_one.assert_called_once()
+    key = mock_cache.set_if_not_exists.call_args[0][0]
+    assert key == "session_activity:token_abc"
+    assert mock_cache.set_if_not_exists.call_args[1]["expire"] == 60
+
+
+@pytest.mark.asyncio
+async def test_is_ip_suspicious_checks_block_key_existence(security_service, mock_cache):
+    """Test an IP is suspicious exactly while its expiring block key exists"""
+
+    mock_cache.cache_exists.return_value = True
+    assert await security_service.is_ip_suspicious("203.0.113.5") is True
+    mock_cache.cache_exists.assert_called_once_with("suspicious_ip:203.0.113.5")
+
+    mock_cache.cache_exists.return_value = False
+    assert await security_service.is_ip_suspicious("203.0.113.5") is False
+    mock_cache.get_cache.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_buffered_event_returns_before_suspicious_activity_check(security_service, mock_db, mock_cache):
+    """Test a buffered event's suspicious activity check runs detached and is awaited on flush"""
+
+    mock_db.security_events.insert_many = AsyncMock()
+    check_started = asyncio.Event()
+    release_check = asyncio.Event()
+
+    async def slow_window(*args):
+        check_started.set()
+        await release_check.wait()
+        return 5
+
+    mock_cache.add_to_sliding_window.side_effect = slow_window
+
+    await security_service.log_security_event(
+        event_type=SecurityEventType.FAILED_LOGIN,
+        ip_address="203.0.113.5",
+        buffered=True
+    )
+
+    await check_started.wait()
+    assert len(SecurityService._pending_checks) == 1
+
+    release_check.set()
+    await SecurityService.flush_buffered_events()
+
+    assert not SecurityService._pending_checks
+    mock_cache.set_cache.assert_called_once()
+    # The suspicious activity event raised by the check is stored directly
+    assert mock_db.security_events.insert_one.call_args[0][0]["event_type"] == "suspicious_activity"